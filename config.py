@@ -36,7 +36,18 @@ DEFAULT_MISC_COLORS = [
 class Config:
     def __init__(self, 
         autosave_interval: float = 60, 
+        compaction_interval: float = 3600,
+        storage_backend: str = "json",
         update_interval: float = 1, 
+        refresh_interval: float = 1,
+        adaptive_sampling: bool = True,
+        idle_sample_interval: float = 10,
+        focus_sample_interval: float = 0.25,
+        focus_flush_interval: float = 5,
+        focus_log_retention_days: float = 7,
+        query_cache_size: int = 128,
+        graph_cache_size: int = 32,
+        startup_time_budget: float = 1.5,
         colors: dict[str,str] = DEFAULT_COLORS, 
         afk_timeout: float = 60, 
         button_width: int = 20,
@@ -54,7 +65,18 @@ class Config:
         **kwargs
     ):        
         self.autosave_interval = autosave_interval
+        self.compaction_interval = compaction_interval
+        self.storage_backend = storage_backend
         self.update_interval = update_interval
+        self.refresh_interval = refresh_interval
+        self.adaptive_sampling = adaptive_sampling
+        self.idle_sample_interval = idle_sample_interval
+        self.focus_sample_interval = focus_sample_interval
+        self.focus_flush_interval = focus_flush_interval
+        self.focus_log_retention_days = focus_log_retention_days
+        self.query_cache_size = query_cache_size
+        self.graph_cache_size = graph_cache_size
+        self.startup_time_budget = startup_time_budget
         self.colors = colors
         self.button_width = button_width
         for k in DEFAULT_COLORS:
@@ -87,7 +109,18 @@ class Config:
     def to_dict(self) -> dict:
         return {
             "autosave_interval": self.autosave_interval,
+            "compaction_interval": self.compaction_interval,
+            "storage_backend": self.storage_backend,
             "update_interval": self.update_interval,
+            "refresh_interval": self.refresh_interval,
+            "adaptive_sampling": self.adaptive_sampling,
+            "idle_sample_interval": self.idle_sample_interval,
+            "focus_sample_interval": self.focus_sample_interval,
+            "focus_flush_interval": self.focus_flush_interval,
+            "focus_log_retention_days": self.focus_log_retention_days,
+            "query_cache_size": self.query_cache_size,
+            "graph_cache_size": self.graph_cache_size,
+            "startup_time_budget": self.startup_time_budget,
             "afk_timeout": self.afk_timeout,
             "button_width": self.button_width,
             "colors": self.colors,
@@ -108,12 +141,19 @@ class Config:
     def load():
         try:
             with open(CONFIG_FILE) as f:
-                r = Config.from_dict(yaml.load(f, yaml.SafeLoader))
-                print("Successfully loaded config")
-                return r
+                data = yaml.load(f, yaml.SafeLoader)
+            r = Config.from_dict(data)
+            print("Successfully loaded config")
+        except FileNotFoundError:
+            data = None
+            r = Config.from_dict({})
         except Exception as e:
             print(f"Error loading config: {e}")
             return Config.from_dict({})
+        # Only write the file when it is missing or lacks some fields, not on every start
+        if data != r.to_dict():
+            r.save()
+        return r
     def save(self):
         with open(CONFIG_FILE, "w") as f:
             yaml.safe_dump(self.to_dict(), f)
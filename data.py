@@ -1,23 +1,29 @@
 from abc import abstractmethod
 from datetime import datetime
-import json
-import math
 import time
+from typing import Iterable
 
 from config import Config
+from lib.cache import LRUCache
+from lib.intervals import FOCUS_LOG_FILE, FocusLog, append_intervals
+from lib.query import query_bounds, query_series
+from lib.storage import CURRENT_SCHEMA_VERSION, DB_FILE, SAVE_COMPACT, SAVE_JOURNAL, BinaryStorage, JsonStorage, PartitionedStorage, SqliteStorage, create_storage
+from lib.timeseries import HOUR, HourlySeries, hour_ceil, hour_index, hour_to_key, hour_to_timestamp
+import numpy as np
 
-DB_FILE = "db.json"
-CURRENT_SCHEMA_VERSION = 1
 P_VIS_DEFAULT = "default"
 P_VIS_PINNED = "pinned"
 P_VIS_HIDDEN = "hidden"
 valid_visibilities = {P_VIS_DEFAULT, P_VIS_PINNED, P_VIS_HIDDEN}
+QUERY_GROUP_PROGRAM = "program"
+QUERY_GROUP_CATEGORY = "category"
+QUERY_GROUP_TOTAL = "total"
 
 def get_time_key(time: float, only_show_day: bool = False) -> str:
     fmt_str = "%Y-%m-%dT%H:00:00" if not only_show_day else "%Y-%m-%d"
     return datetime.fromtimestamp(time).strftime(fmt_str)
-def get_time_key_pretty(time: float, only_show_day: bool = False) -> str:
-    fmt_str = "%b %d %I%p" if not only_show_day else "%b %d"
+def get_time_key_pretty(time: float, only_show_day: bool = False, show_minutes: bool = False) -> str:
+    fmt_str = "%b %d" if only_show_day else "%b %d %I:%M%p" if show_minutes else "%b %d %I%p"
     return datetime.fromtimestamp(time).strftime(fmt_str)
 
 def get_time_from_key(key: str) -> float:
@@ -27,24 +33,84 @@ def time_to_date_str(time: float, fmt: str = "%Y-%m-%d") -> str:
     return datetime.fromtimestamp(time).strftime(fmt)
 
 class Profile:
-    def __init__(self, config: Config, programs: dict = {}, selected_program = "", **kwargs):
+    def __init__(self, config: Config, programs: dict = {}, selected_program = "", journal_id: int = 0, **kwargs):
         self.programs: dict[str, ProgramData] = {k: ProgramData.from_dict(config, k,v) for k,v in programs.items()}
         self.session_data: dict[str, ProgramData] = {}
         self.other_params = kwargs
-        self.selected_program: ITask = None
-        if selected_program.startswith("CATEGORY_"):
-            self.selected_program: ITask = CategoryTask(selected_program[9:], self)
-        else:
-            self.selected_program: ITask = self.programs.get(selected_program, DEFAULT_PROGRAM_DATA)
+        self.selected_program: ITask = self.find_task(selected_program)
         self.config = config
         self.afk_time : float = 0
 
+        # Running totals over visible programs, kept up to date by ProgramData
+        self.category_time: dict[str, float] = {}
+        self.category_session_time: dict[str, float] = {}
+        self.total_time: float = 0
+        self.total_session_time: float = 0
+        for p in self.programs.values():
+            p.owner = self
+        self.recompute_totals()
+
+        # Changes since the last save, written by self.storage
+        self.storage: JsonStorage | SqliteStorage | BinaryStorage | PartitionedStorage = JsonStorage()
+        self.journal_id = journal_id
+        self.journal_ready = False
+        self.pending_time: dict[tuple[str, int], float] = {}
+        self.pending_meta: set[str] = set()
+        self.journaled_selection = selected_program
+        self.last_compaction = time.time()
+
+        # Programs whose displayed values changed since the view last looked, see take_changes
+        self.changed: set[str] = set()
+        self.layout_changed = True
+
+        # Recent focus intervals, the source of the hourly series and of sub-hour queries
+        self.focus_log = FocusLog(config.focus_log_retention_days * 24 * HOUR)
+
+        # Bumped on every change, and on changes that reach before the current hour; see version_token
+        self.data_version = 0
+        self.history_version = 0
+        self.query_cache = LRUCache(config.query_cache_size)
+
     def to_dict(self):
         return {
             "version": CURRENT_SCHEMA_VERSION,
             "programs": {k: v.to_dict() for k,v in self.programs.items()},
             "selected_program": self.selected_program.get_id(),
+            "journal_id": self.journal_id,
         }
+    def snapshot(self) -> dict:
+        '''Like to_dict, but holding copies of the series so it can be serialized later on another thread'''
+        return {
+            "version": CURRENT_SCHEMA_VERSION,
+            "programs": {k: v.snapshot() for k,v in self.programs.items()},
+            "selected_program": self.selected_program.get_id(),
+            "journal_id": self.journal_id,
+        }
+
+    def detached_copy(self, programs: "list[ProgramData] | None" = None, start: float | None = None, end: float | None = None) -> "Profile":
+        '''Copy of `programs` (all of them by default) that another thread can query while this profile keeps changing.
+        With `start` and `end`, only the hours in that range are copied and the copy can only be queried inside it.'''
+        copy = Profile(self.config)
+        copy.storage = self.storage
+        hours = (hour_ceil(start), hour_ceil(end)) if start is not None and end is not None else None
+        for p in (programs or self.programs.values()):
+            program = p.detached_copy(hours)
+            program.owner = copy
+            copy.programs[p.id] = program
+        copy.focus_log = self.focus_log.copy()
+        copy.recompute_totals()
+        # Same data at the same versions, so cached query results are shared
+        copy.data_version = self.data_version
+        copy.history_version = self.history_version
+        copy.query_cache = self.query_cache
+        return copy
+
+    def find_task(self, task_id: str) -> "ITask":
+        if task_id.startswith("CATEGORY_"):
+            return CategoryTask(task_id[9:], self)
+        if task_id == "Total":
+            return TotalTask(self)
+        return self.programs.get(task_id, DEFAULT_PROGRAM_DATA)
     
     @staticmethod
     def from_dict(config: Config, data: dict):
@@ -55,34 +121,175 @@ class Profile:
     
     @staticmethod
     def load(config: Config) -> "Profile":
-        try:
-            with open(DB_FILE) as f:
-                return Profile.from_dict(config, json.load(f))
-        except Exception as e:
-            print(f"Error loading profile: {e}")
-            return Profile.from_dict(config, {})
-    def save(self):
-        with open(DB_FILE, "w") as f:
-            json.dump(self.to_dict(), f, indent = 2)
+        storage = create_storage(config.storage_backend)
+        if storage.migrate_from_json and not storage.exists() and JsonStorage().exists():
+            print(f"Migrating profile from {DB_FILE} to {config.storage_backend} storage")
+            storage.import_snapshot(Profile.load_from(config, JsonStorage()).snapshot())
+        return Profile.load_from(config, storage)
+    @staticmethod
+    def load_from(config: Config, storage: JsonStorage | SqliteStorage | BinaryStorage | PartitionedStorage) -> "Profile":
+        data, journal = storage.load()
+        profile = Profile.from_dict(config, data or {})
+        profile.storage = storage
+        if storage.lazy_series:
+            for p in profile.programs.values():
+                p.unload_series()
+        if journal is not None:
+            profile.replay_journal(journal)
+        profile.focus_log = FocusLog.load(FOCUS_LOG_FILE, profile.focus_log.retention, time.time())
+        return profile
+    def save(self, compact: bool = False):
+        '''Append the changes since the last save to the journal, or rewrite the full snapshot when compacting'''
+        job = self.prepare_save(compact)
+        if job:
+            self.write_save(job)
+
+    def prepare_save(self, compact: bool = False) -> dict | None:
+        '''Capture what needs to be written; the result can be handed to write_save on any thread'''
+        self.flush_focus_log()
+        intervals = self.focus_log.take_unsaved()
+        if not self.storage.snapshots:
+            compact = False
+        elif not self.journal_ready or time.time() - self.last_compaction >= self.config.compaction_interval:
+            compact = True
+        if compact:
+            self.journal_id += 1
+            self.take_journal_entry()
+            self.storage.detach_history(self.programs.values())
+            self.journal_ready = True
+            self.last_compaction = time.time()
+            job = {"kind": SAVE_COMPACT, "journal_id": self.journal_id, "snapshot": self.snapshot()}
+        else:
+            entry = self.take_journal_entry()
+            if not entry and not intervals:
+                return None
+            job = {"kind": SAVE_JOURNAL, "entry": entry}
+        if intervals:
+            job["intervals"] = intervals
+        return job
+    def write_save(self, job: dict):
+        if job["kind"] == SAVE_COMPACT or job["entry"]:
+            self.storage.write(job)
+            # Only the intervals are left, should appending them fail and the job be written again
+            job.pop("snapshot", None)
+            job["kind"], job["entry"] = SAVE_JOURNAL, None
+        if job.get("intervals"):
+            append_intervals(FOCUS_LOG_FILE, job["intervals"])
+
+    def flush_focus_log(self):
+        '''Credit the focus intervals recorded since the last flush to their programs'''
+        def credit(name: str, afk: bool, start: float, end: float):
+            program = self.programs.get(name)
+            if program is None or (afk and program.has_afk_timer()):
+                return
+            program.add_time(end - start, start)
+        self.focus_log.flush(credit)
+        self.focus_log.prune(time.time())
+
+    def take_journal_entry(self) -> dict | None:
+        '''Collect and clear the pending changes'''
+        entry = {}
+        if self.pending_time:
+            entry["time"] = [[k, h, d] for (k, h), d in self.pending_time.items()]
+        if self.pending_meta:
+            entry["meta"] = {k: self.programs[k].metadata_dict() for k in self.pending_meta if k in self.programs}
+        selection = self.selected_program.get_id()
+        if selection != self.journaled_selection:
+            entry["selected_program"] = selection
+        self.pending_time = {}
+        self.pending_meta = set()
+        self.journaled_selection = selection
+        return entry or None
+
+    def replay_journal(self, entries: list[dict]):
+        if entries:
+            print(f"Replaying {len(entries)} journal entries")
+        for entry in entries:
+            for k, meta in entry.get("meta", {}).items():
+                if k in self.programs:
+                    self.programs[k].apply_metadata(meta)
+                else:
+                    self.programs[k] = ProgramData.from_dict(self.config, k, meta)
+                    self.programs[k].owner = self
+            for k, hour, delta in entry.get("time", []):
+                program = self.get_program(k)
+                program.time += delta
+                program.time_series.add(hour, delta)
+            if "selected_program" in entry:
+                self.selected_program = self.find_task(entry["selected_program"])
+        self.take_journal_entry()
+        self.recompute_totals()
+        self.journal_ready = True
 
     def get_program(self, key: str) -> "ProgramData | None":
         if not key in self.programs:
             autohide = key.isspace() or self.config.should_autohide(key)
-            self.programs[key] = ProgramData(self.config, key, visibility = P_VIS_HIDDEN if autohide else P_VIS_DEFAULT)
+            program = ProgramData(self.config, key, visibility = P_VIS_HIDDEN if autohide else P_VIS_DEFAULT)
+            program.owner = self
+            self.programs[key] = program
+            self.track_program(program)
+            self.pending_meta.add(key)
+            self.layout_changed = True
         return self.programs[key]
+
+    def on_time_added(self, program: "ProgramData", hour: int, delta: float):
+        key = (program.id, hour)
+        self.pending_time[key] = self.pending_time.get(key, 0) + delta
+        if program.is_visible():
+            self.add_to_totals(program, delta, delta)
+        self.changed.add(program.id)
+        self.data_version += 1
+        if hour < hour_index(time.time()):
+            self.history_version += 1
+    def on_metadata_changed(self, program: "ProgramData"):
+        self.pending_meta.add(program.id)
+        self.changed.add(program.id)
+        self.layout_changed = True
+        self.data_version += 1
+        self.history_version += 1
+    def version_token(self, end: float) -> tuple[str, int]:
+        '''Changes whenever data visible to a query ending at `end` may have changed. Ranges that end
+        before the current hour only depend on the history version, so they stay valid across ticks.'''
+        if end <= hour_to_timestamp(hour_index(time.time())):
+            return ("history", self.history_version)
+        return ("data", self.data_version)
+    def take_changes(self) -> tuple[set[str], bool]:
+        '''Programs changed since the last call, and whether any visibility or category changed with them'''
+        changed, layout_changed = self.changed, self.layout_changed
+        self.changed = set()
+        self.layout_changed = False
+        return changed, layout_changed
+
+    def recompute_totals(self):
+        self.category_time = {}
+        self.category_session_time = {}
+        self.total_time = 0
+        self.total_session_time = 0
+        for p in self.programs.values():
+            self.track_program(p)
+    def track_program(self, program: "ProgramData", sign: int = 1):
+        '''Add (or with sign = -1, remove) a program's contribution to the running totals'''
+        if not program.is_visible():
+            return
+        self.add_to_totals(program, sign * program.time, sign * program.session_time)
+    def add_to_totals(self, program: "ProgramData", delta: float, session_delta: float):
+        self.category_time[program.category] = self.category_time.get(program.category, 0) + delta
+        self.category_session_time[program.category] = self.category_session_time.get(program.category, 0) + session_delta
+        self.total_time += delta
+        self.total_session_time += session_delta
     
     def get_category_time(self, category: str) -> float:
         if category == "":
             return self.get_total_time()
-        return sum(p.time for p in self.programs.values() if p.category == category and p.is_visible())
+        return self.category_time.get(category, 0)
     def get_category_session_time(self, category: str) -> float:
         if category == "":
             return self.get_total_session_time()
-        return sum(p.session_time for p in self.programs.values() if p.category == category and p.is_visible())
+        return self.category_session_time.get(category, 0)
     def get_total_time(self) -> float:
-        return sum(p.time for p in self.programs.values() if p.is_visible())
+        return self.total_time
     def get_total_session_time(self) -> float:
-        return sum(p.session_time for p in self.programs.values() if p.is_visible())
+        return self.total_session_time
     
     def get_first_timekey(self):
         return min(p.get_first_timekey() for p in self.programs.values())
@@ -92,6 +299,81 @@ class Profile:
         return get_time_from_key(self.get_first_timekey())
     def get_last_timestamp(self):
         return get_time_from_key(self.get_last_timekey())
+
+    def hourly_values(self, programs: "list[ProgramData]", hour_start: int, hour_end: int) -> np.ndarray:
+        '''Time of each of `programs` in every local hour of [hour_start, hour_end), including history kept by the storage.
+        Returns a (programs x hours) matrix.'''
+        result = np.zeros((len(programs), hour_end - hour_start))
+        for row, program in zip(result, programs):
+            if not program.is_series_loaded() or program.time_series.is_empty():
+                continue
+            series = program.time_series
+            lo, hi = max(hour_start, series.first_hour()), min(hour_end, series.last_hour() + 1)
+            if lo < hi:
+                row[lo - hour_start:hi - hour_start] = np.frombuffer(series.values, dtype=np.float64)[lo - series.base:hi - series.base]
+        stored = [i for i,p in enumerate(programs) if self.storage.cold_history or not p.is_series_loaded()]
+        if stored:
+            result[stored] += self.storage.query_buckets([programs[i].id for i in stored], np.arange(hour_start, hour_end + 1, dtype=np.int64))
+        return result
+
+    def add_history(self, rows: Iterable[tuple[str, str, int, float]]):
+        '''Add (program id, category, hour, seconds) rows of past time, e.g. from an import. Programs that
+        don't exist yet are created in the given category. Like any other change, the rows are written by the next save.'''
+        for key, category, hour, delta in rows:
+            program = self.programs.get(key)
+            if program is None:
+                program = self.get_program(key)
+                program.set_category(category)
+            program.time += delta
+            program.time_series.add(hour, delta)
+            self.pending_time[(key, hour)] = self.pending_time.get((key, hour), 0) + delta
+            self.changed.add(key)
+        # Imported time is not part of this session, so the totals are rebuilt rather than updated like on_time_added does
+        self.recompute_totals()
+        self.data_version += 1
+        self.history_version += 1
+
+    def query(self, start: float, end: float, step: float | None = None, group_by: str = QUERY_GROUP_PROGRAM, programs: "list[ProgramData] | None" = None) -> tuple[list[str], np.ndarray]:
+        '''Bucket the time of `programs` (all visible programs by default) over [start, end) in a single pass.
+        Returns the row keys (program ids, categories or "Total") and a (rows x buckets) matrix.'''
+        if programs is None or len(programs) == 0:
+            programs = [p for p in self.programs.values() if p.is_visible()]
+        if step is None:
+            step = end - start
+        # Sub-hour queries read focus intervals that are not versioned until they are flushed
+        cache_key = (start, end, step, group_by, tuple(p.id for p in programs), self.version_token(end)) if step >= HOUR else None
+        cached = self.query_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return list(cached[0]), cached[1].copy()
+        if group_by == QUERY_GROUP_PROGRAM:
+            keys = [p.id for p in programs]
+            groups = list(range(len(programs)))
+        elif group_by == QUERY_GROUP_CATEGORY:
+            keys = list(self.config.categories)
+            index = {c: i for i,c in enumerate(keys)}
+            groups = [index[p.category] for p in programs]
+        elif group_by == QUERY_GROUP_TOTAL:
+            keys = ["Total"]
+            groups = [0] * len(programs)
+        else:
+            raise ValueError(f"Unknown query grouping {group_by}")
+        if step < HOUR:
+            # Sub-hour buckets come from the focus log, which only covers the retention window
+            edges = np.append(np.arange(start, end, step), end)
+            count_afk = [not p.has_afk_timer() for p in programs]
+            return keys, self.focus_log.query([p.id for p in programs], groups, len(keys), edges, count_afk)
+        bounds = query_bounds(start, end, step)
+        loaded = [i for i,p in enumerate(programs) if p.is_series_loaded()]
+        result = query_series([programs[i].time_series for i in loaded], [groups[i] for i in loaded], len(keys), bounds)
+        # Programs that were never touched this session, or all of them if older history stays in storage,
+        # are aggregated by the storage backend
+        stored = [i for i,p in enumerate(programs) if self.storage.cold_history or not p.is_series_loaded()]
+        if stored:
+            rows = self.storage.query_buckets([programs[i].id for i in stored], bounds)
+            np.add.at(result, [groups[i] for i in stored], rows)
+        if cache_key:
+            self.query_cache.put(cache_key, (keys, result.copy()))
+        return keys, result
     
 class ITask:
     @abstractmethod
@@ -115,24 +397,60 @@ class ITask:
     def get_last_timestamp(self): pass
 
 class ProgramData(ITask):
-    def __init__(self, config: Config, id: str, time: float = 0, time_series: dict[str,float] = {}, visibility: str = P_VIS_DEFAULT, program_type: str = None, display_name: str | None = None, afk_sensitive: bool = True):
+    def __init__(self, config: Config, id: str, time: float = 0, time_series: dict | None = None, visibility: str = P_VIS_DEFAULT, program_type: str = None, display_name: str | None = None, afk_sensitive: bool = True):
         self.config = config
         if program_type is None:
             program_type = config.default_category
         self.id = id
         self.time = time
-        self.time_series = time_series
+        self._time_series: HourlySeries | None = HourlySeries.from_dict(time_series)
         self.session_time = 0
         self.display_name = self.id.title() if not display_name else display_name
         self.visibility = visibility if visibility in valid_visibilities else P_VIS_DEFAULT
         self.category = program_type if program_type in config.categories else config.default_category
         self.afk_sensitive = afk_sensitive
+        self.owner: Profile | None = None
 
     def to_dict(self):
         result = {
             "time": self.time,
-            "time_series": self.time_series,
+            "time_series": self.time_series.to_dict(),
+        }
+        result.update(self.metadata_dict())
+        return result
+    @property
+    def time_series(self) -> HourlySeries:
+        if self._time_series is None:
+            self._time_series = self.owner.storage.load_series(self.id)
+        return self._time_series
+    def is_series_loaded(self) -> bool:
+        return self._time_series is not None
+    def unload_series(self):
+        '''Drop the in-memory series so that it is read from the owner's storage when next needed'''
+        self._time_series = None
+
+    def detached_copy(self, hours: tuple[int, int] | None = None) -> "ProgramData":
+        program = ProgramData(self.config, self.id, self.time, **self.metadata_dict())
+        program.session_time = self.session_time
+        if not self.is_series_loaded():
+            program._time_series = None
+        elif hours is None:
+            program._time_series = self._time_series.copy()
+        else:
+            program._time_series = self._time_series.slice(*hours)
+        return program
+
+    def snapshot(self):
+        result = {
+            "time": self.time,
+            # An unloaded series is unchanged since it was last written, so the storage can reuse what it has
+            "time_series": self._time_series.copy() if self.is_series_loaded() else None,
         }
+        result.update(self.metadata_dict())
+        return result
+
+    def metadata_dict(self):
+        result = {}
         if self.visibility != P_VIS_DEFAULT:
             result["visibility"] = self.visibility
         if self.category != self.config.default_category:
@@ -141,8 +459,14 @@ class ProgramData(ITask):
             result["display_name"] = self.display_name
         if not self.afk_sensitive:
             result["afk_sensitive"] = False
-        
         return result
+
+    def apply_metadata(self, data: dict):
+        parsed = ProgramData(self.config, self.id, **data)
+        self.set_visibility(parsed.visibility)
+        self.set_category(parsed.category)
+        self.set_afk_sensitive(parsed.afk_sensitive)
+        self.display_name = parsed.display_name
     
     def __repr__(self) -> str:
         return f"ProgramData({self.id}, {self.time}, {self.visibility}, {self.category})"
@@ -164,42 +488,70 @@ class ProgramData(ITask):
 
     def is_visible(self):
         return self.visibility != P_VIS_HIDDEN
+
+    def set_visibility(self, visibility: str):
+        if self.owner: self.owner.track_program(self, -1)
+        self.visibility = visibility if visibility in valid_visibilities else P_VIS_DEFAULT
+        if self.owner:
+            self.owner.track_program(self)
+            self.owner.on_metadata_changed(self)
+    def set_category(self, category: str):
+        if self.owner: self.owner.track_program(self, -1)
+        self.category = category if category in self.config.categories else self.config.default_category
+        if self.owner:
+            self.owner.track_program(self)
+            self.owner.on_metadata_changed(self)
+    def set_afk_sensitive(self, afk_sensitive: bool):
+        self.afk_sensitive = afk_sensitive
+        if self.owner: self.owner.on_metadata_changed(self)
     def has_afk_timer(self):
         return self.afk_sensitive
 
     def sortkey(self):
         return (0 if self.visibility == P_VIS_PINNED else 1, -self.time)
     
-    def add_time(self, delta: float, now: float = time.time()):
+    def add_time(self, delta: float, now: float | None = None):
+        if now is None:
+            now = time.time()
         self.time += delta
         self.session_time += delta
-        time_key = get_time_key(now)
-        if not time_key in self.time_series:
-            self.time_series[time_key] = 0
-        # print(f"Adding {delta:.3f} to {self.display_name} at {time_key}")
-        self.time_series[time_key] += delta
-        # print("  New value:" , self.time_series[time_key])
+        hour = hour_index(now)
+        self.time_series.add(hour, delta)
+        if self.owner:
+            self.owner.on_time_added(self, hour, delta)
 
     def get_bucketed_time(self, start: float, end: float | None = None, bucket_size = 60 * 60) -> list[float]:
         if end is None:
             end = start + bucket_size
-        num_buckets = math.ceil((end - start) / bucket_size)
-        result = [0 for _ in range(num_buckets)]
-        for k,v in self.time_series.items():
-            time = get_time_from_key(k)
-            if time < start or time >= end:
-                continue
-            idx = int((time - start) / bucket_size)
-            result[idx] += v
-        return result
+        if self.owner and self.owner.storage.cold_history:
+            return self.owner.query(start, end, bucket_size, QUERY_GROUP_PROGRAM, [self])[1][0].tolist()
+        return self.time_series.bucketed(start, end, bucket_size)
     
     def get_timeframe_time(self, start: float, end: float) -> float:
-        return sum(v for k,v in self.time_series.items() if start <= get_time_from_key(k) < end)
+        if self.owner and self.owner.storage.cold_history:
+            return float(self.owner.query(start, end, None, QUERY_GROUP_PROGRAM, [self])[1][0, 0])
+        return self.time_series.timeframe_sum(start, end)
     
+    def get_hour_bounds(self) -> tuple[int, int] | None:
+        bounds = []
+        if self.is_series_loaded() and not self.time_series.is_empty():
+            bounds.append((self.time_series.first_hour(), self.time_series.last_hour()))
+        if self.owner and (self.owner.storage.cold_history or not self.is_series_loaded()):
+            stored = self.owner.storage.series_bounds(self.id)
+            if stored: bounds.append(stored)
+        if not bounds:
+            return None
+        return min(b[0] for b in bounds), max(b[1] for b in bounds)
     def get_first_timekey(self):
-        return min(self.time_series.keys(), default = get_time_key(time.time()))
+        bounds = self.get_hour_bounds()
+        if bounds is None:
+            return get_time_key(time.time())
+        return hour_to_key(bounds[0])
     def get_last_timekey(self):
-        return max(self.time_series.keys(), default = get_time_key(time.time()))
+        bounds = self.get_hour_bounds()
+        if bounds is None:
+            return get_time_key(time.time())
+        return hour_to_key(bounds[1])
     def get_first_timestamp(self):
         return get_time_from_key(self.get_first_timekey())
     def get_last_timestamp(self):
@@ -267,4 +619,11 @@ def read_old_profile(config: Config, data: dict, version: int) -> Profile:
             config,
             programs = {k: ProgramData(config, k, time=v).to_dict() for k,v in data.items()}
         )
+    if version == 1:
+        # time_series is dict[str, float] keyed by get_time_key
+        programs = {}
+        for k,v in data.get("programs", {}).items():
+            series = HourlySeries.from_keyed_dict(v.get("time_series", {}))
+            programs[k] = {**v, "time_series": series.to_dict()}
+        return Profile(config, programs = programs, selected_program = data.get("selected_program", ""))
     raise ValueError(f"Unknown schema version {version}")
@@ -1,20 +1,37 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-from PIL import ImageTk, Image
-from matplotlib import pyplot as plt
-from tkcalendar import Calendar, DateEntry
 from tkinter.messagebox import askokcancel
 from threading import Thread
-from typing import Any
+from typing import Any, TYPE_CHECKING
 from datetime import datetime, date
+import math
+import time
 
 from config import Config
 from data import *
-from lib import graphs
 from lib.errors import GraphingError
 from lib.mathlib import time_to_str, clamp
-from lib.components import ScrollableFrame, ProgramSetSelector
+from lib.components import VirtualList
+from lib.cache import LRUCache
+from lib.constants import GRAPH_DEBOUNCE_MS, GRAPH_POLL_MS
+from lib.saver import BackgroundSaver
+from lib.scheduler import Scheduler
+from lib.timeseries import HOUR
+
+# The statistics window pulls in matplotlib, PIL and the calendar widgets, which are slow to import.
+# They are loaded when it is first opened (or by preload_statistics), not at startup.
+if TYPE_CHECKING:
+    from PIL import ImageTk
+    from lib.render import RenderResult
+
+def preload_statistics():
+    '''Import the modules used by StatisticsWindow ahead of time, e.g. on a background thread'''
+    try:
+        import PIL.ImageTk, tkcalendar, ttkwidgets
+        import lib.graphs, lib.render
+    except Exception as e:
+        print(f"Error preloading statistics: {e}")
 
 class TimeWidget:
     def __init__(self, app: "App", root: tk.Tk, program_data: ProgramData = DEFAULT_PROGRAM_DATA):
@@ -23,6 +40,7 @@ class TimeWidget:
         self.frame = tk.Frame(master = root, bg = app.config.get_color("unselected"), border=1, relief="solid")
         self.data = program_data
         self.selected = None # temporary
+        self.shown: tuple | None = None
 
         # Widgets & Variables
         self.hide_button = ttk.Button(master = self.frame, text = "Hide", command = self.hide_program, style = "Danger.TButton")
@@ -38,6 +56,7 @@ class TimeWidget:
         self.afk_var = tk.BooleanVar(value = program_data.afk_sensitive)
         self.afk_checkbox = ttk.Checkbutton(self.frame, text = "Can AFK?", variable = self.afk_var, command=self.set_afk)
         self.graph_button = ttk.Button(self.frame, text = "Graph", command = lambda: self.app.show_graph_window([self.data]))
+        self.shown_vars = (self.label_text, self.button_text, self.pinned_var, self.type_var, self.afk_var)
 
         # Structure
         self.hide_button.pack(side = 'left', padx = 10)
@@ -47,7 +66,6 @@ class TimeWidget:
         self.afk_checkbox.pack(side = 'left', padx = 10)
         self.type_combobox.pack(side = 'left', padx = 10)
         self.graph_button.pack(side = 'left', padx = 10)
-        self.frame.pack(side='top', fill='x', expand=True)
 
         # Style initialization
         self.set_highlight(self.data.id == self.app.profile.selected_program.get_id())
@@ -58,32 +76,33 @@ class TimeWidget:
     def hide_program(self):
         confirmation = askokcancel("Hide program", f"Are you sure you want to hide {self.data.display_name}?")
         if (confirmation):
-            self.data.visibility = P_VIS_HIDDEN
+            self.data.set_visibility(P_VIS_HIDDEN)
             self.app.update_view()
 
     def set_pinned(self):
         pinned = self.pinned_var.get()
-        self.data.visibility = P_VIS_PINNED if pinned else P_VIS_DEFAULT
+        self.data.set_visibility(P_VIS_PINNED if pinned else P_VIS_DEFAULT)
         self.app.update_view()
     def set_afk(self):
         afk = self.afk_var.get()
-        self.data.afk_sensitive = afk
+        self.data.set_afk_sensitive(afk)
         print(f"Setting afk sensitivity for {self.data.display_name} to {afk}")
         self.app.update_view()
 
     def set_ptype(self, _evt):
-        self.data.category = self.type_var.get()
+        self.data.set_category(self.type_var.get())
         self.app.update_view()
 
     def update_program(self, data: ProgramData):
         self.data = data
         self.set_highlight(self.data.id == self.app.profile.selected_program.get_id())
 
-        self.label_text.set(time_to_str(data.time))
-        self.button_text.set(data.id)
-        self.pinned_var.set(data.visibility == P_VIS_PINNED)
-        self.type_var.set(data.category)
-        self.afk_var.set(data.afk_sensitive)
+        shown = (time_to_str(data.time), data.id, data.visibility == P_VIS_PINNED, data.category, data.afk_sensitive)
+        if shown == self.shown: return
+        # Only touch the Tk variables whose value is actually different
+        for var, old, new in zip(self.shown_vars, self.shown or (None,) * len(shown), shown):
+            if old != new: var.set(new)
+        self.shown = shown
 
     def set_highlight(self, selected: bool):
         if self.selected == selected: return
@@ -131,7 +150,7 @@ class TimerWindow:
         color = "idle"
         if self.app.profile.afk_time >= self.app.config.afk_timeout: color = "afk"
         
-        active_program: ProgramData | None = self.app.profile.get_program(self.app.active_window)
+        active_program: ProgramData | None = self.app.profile.programs.get(self.app.active_window)
         if  isinstance(task, TotalTask) or \
             isinstance(task, CategoryTask) and active_program and task.category == active_program.category or \
             isinstance(task, ProgramData) and active_program and task.get_id() == active_program.id: 
@@ -150,6 +169,7 @@ class CategoryInfoWidget:
         self.category = category
         self.root = root
         self.frame = tk.Frame(master = root)
+        self.shown: tuple | None = None
         self.task = CategoryTask(category, app.profile) if category else TotalTask(app.profile)
         self.title_button = ttk.Button(master = self.frame, text = self.task.get_name(), command=lambda: app.set_task(self.task))
         self.time_session_var = tk.StringVar(value = f"({app.profile.get_category_session_time(category)})")
@@ -167,19 +187,34 @@ class CategoryInfoWidget:
         bg_color = self.app.config.get_color("unselected")
         if self.app.profile.selected_program == self.task:
             bg_color = self.app.config.get_color("active")
-        self.frame.configure(bg = bg_color)
-        self.time_session_var.set(f"{time_to_str(self.app.profile.get_category_session_time(self.category))}")
-        self.time_var.set(f"({time_to_str(self.app.profile.get_category_time(self.category))})")
-        self.session_timer_label.configure(background = bg_color)
-        self.timer_label.configure(background = bg_color)
+        session_text = f"{time_to_str(self.app.profile.get_category_session_time(self.category))}"
+        time_text = f"({time_to_str(self.app.profile.get_category_time(self.category))})"
+        shown = (bg_color, session_text, time_text)
+        if shown == self.shown: return
+        if self.shown is None or self.shown[0] != bg_color:
+            self.frame.configure(bg = bg_color)
+            self.session_timer_label.configure(background = bg_color)
+            self.timer_label.configure(background = bg_color)
+        self.time_session_var.set(session_text)
+        self.time_var.set(time_text)
+        self.shown = shown
 
 class StatisticsWindow:
     def __init__(self, app: "App", selected_programs: list[ProgramData] = []):
+        from tkcalendar import DateEntry
+        from lib.components import ProgramSetSelector
+        from lib.render import GraphRenderer
         # Local data and variables
         self.app = app
         self.selected_timestep = 3600 * 24
-        self.timestep_options = [(3600, "hourly"), (3600 * 24, "daily"), (3600 * 24 * 7, "weekly")]
-        self.graph_image: ImageTk.PhotoImage | None = None
+        self.timestep_options = [(60, "1 min"), (60 * 5, "5 min"), (60 * 15, "15 min"), (3600, "hourly"), (3600 * 24, "daily"), (3600 * 24 * 7, "weekly")]
+        self.graph_image: "ImageTk.PhotoImage | None" = None
+        # Graphs are built and drawn by the renderer's thread, this window only shows the latest result
+        self.renderer = GraphRenderer()
+        self.render_generation = 0
+        self.render_key: tuple | None = None
+        self.debounce_id: str | None = None
+        self.poll_id: str | None = None
 
         self.window = tk.Toplevel(app.window)
         self.window.wait_visibility()
@@ -213,8 +248,10 @@ class StatisticsWindow:
         self.display_mode_selector = ttk.Combobox(master = self.option_frame, textvariable=self.display_mode_var, values = list(self.display_options.keys()), state = "readonly")
         self.display_mode_selector.bind("<<ComboboxSelected>>", self.update_graph)
         self.program_selector = ProgramSetSelector(self.window, app.config, app.profile, selected_programs = selected_programs)
+        self.program_selector.tree.bind("<ButtonRelease-1>", self.update_graph, add = True)
 
         self.canvas = tk.Canvas(self.window, bg = "#ffffff")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
         self._reset_t_end(None, False) # must be done first
         self._reset_t_start(None, False)
 
@@ -234,28 +271,94 @@ class StatisticsWindow:
         self.update_graph()
 
     def update_graph(self, _evt = None):
+        '''Request a redraw; bursts of changes are debounced into a single render'''
+        if self.debounce_id:
+            self.window.after_cancel(self.debounce_id)
+        self.debounce_id = self.window.after(GRAPH_DEBOUNCE_MS, self.submit_graph)
+        self.show_status("Rendering…")
+
+    def submit_graph(self):
+        self.debounce_id = None
         display_mode = self.display_mode_var.get()
         graphtype, split_by_categories, split_by_programs = self.display_options[display_mode]
         selected_programs = self.program_selector.get_checked()
-        timestamp_stop = self.timestamp_end + self.selected_timestep
-        try:
+        config = self.app.config
+        timestep = self.selected_timestep
+        timestamp_start, timestamp_stop = self.graph_range(timestep)
+        size = (self.canvas.winfo_width() - 40, self.canvas.winfo_height() - 40)
+        # Look the graph up before copying anything, a cached render doesn't need the profile at all
+        self.render_key = (display_mode, timestep, timestamp_start, timestamp_stop, frozenset(p.id for p in selected_programs), self.app.profile.version_token(timestamp_stop), size)
+        cached = self.app.graph_cache.get(self.render_key)
+        if cached is not None:
+            self.renderer.cancel()
+            if self.poll_id:
+                self.window.after_cancel(self.poll_id)
+                self.poll_id = None
+            self.show_graph(cached)
+            return
+        if timestamp_start >= timestamp_stop:
+            self.show_status(f"Minute steps only cover the last {config.focus_log_retention_days} days")
+            return
+        # The worker reads a detached copy of the range, the live profile keeps changing on this thread
+        profile = self.app.profile.detached_copy(selected_programs or [p for p in self.app.profile.programs.values() if p.is_visible()], timestamp_start, timestamp_stop)
+        programs = [profile.programs[p.id] for p in selected_programs]
+        def build(figure):
+            from lib import graphs
             if graphtype == "Bar":
-                figure, _ = graphs.build_activity_graph(self.app.profile, self.app.config, self.timestamp_start, timestamp_stop, self.selected_timestep, split_by_categories, split_by_programs, selected_programs)
+                graphs.build_activity_graph(profile, config, timestamp_start, timestamp_stop, timestep, split_by_categories, split_by_programs, programs, fig = figure)
             elif graphtype == "Pie":
-                figure, _ = graphs.build_pie_chart(self.app.profile, self.app.config, self.timestamp_start, timestamp_stop, split_by_categories, selected_programs)
-        except GraphingError as e:
-            messagebox.showerror("Graphing Error", f"{e}")
+                graphs.build_pie_chart(profile, config, timestamp_start, timestamp_stop, split_by_categories, programs, fig = figure)
+        self.render_generation = self.renderer.submit(build, size)
+        if not self.poll_id:
+            self.poll_id = self.window.after(GRAPH_POLL_MS, self.poll_graph)
+
+    def graph_range(self, timestep: int) -> tuple[float, float]:
+        '''Start and end of the graph. Minute steps come from the focus log, so they are limited to its retention
+        and to the last max_plot_buckets steps of the selected range.'''
+        if timestep >= HOUR:
+            return self.timestamp_start, self.timestamp_end + timestep
+        now = time.time()
+        # timestamp_end may be the start of the last tracked hour, whose intervals are the ones worth seeing
+        timestamp_stop = min(self.timestamp_end + HOUR, math.ceil(now / timestep) * timestep)
+        timestamp_start = max(self.timestamp_start, timestamp_stop - self.app.config.max_plot_buckets * timestep, math.ceil((now - self.app.profile.focus_log.retention) / timestep) * timestep)
+        return timestamp_start, timestamp_stop
+
+    def poll_graph(self):
+        self.poll_id = None
+        result = self.renderer.take_result()
+        if result is None or result.generation != self.render_generation:
+            self.poll_id = self.window.after(GRAPH_POLL_MS, self.poll_graph)
+            return
+        if result.error is None:
+            self.app.graph_cache.put(self.render_key, result)
+        self.show_graph(result)
+
+    def show_graph(self, result: "RenderResult"):
+        from PIL import ImageTk, Image
+        self.canvas.delete("all")
+        if isinstance(result.error, GraphingError):
+            messagebox.showerror("Graphing Error", f"{result.error}")
+            return
+        if result.error:
+            print(f"Error rendering graph: {result.error}")
             return
-        TEMP_FILENAME = "temp_graph.png"
-        figure.savefig(TEMP_FILENAME)
-        plt.close(figure)
-        # with open(TEMP_FILENAME, "rb") as f:
-            # img = Image.open(f)
-            # img = img.resize((800, 600), resample=Image.Resampling.BICUBIC)
-        self.graph_image = ImageTk.PhotoImage(Image.open(TEMP_FILENAME))
+        self.graph_image = ImageTk.PhotoImage(Image.frombuffer("RGBA", result.size, result.rgba, "raw", "RGBA", 0, 1))
         self.canvas.create_image(20, 20, image = self.graph_image, anchor = "nw")
         self.canvas.image = self.graph_image # keep a reference to the image
 
+    def show_status(self, text: str):
+        self.canvas.delete("status")
+        self.canvas.create_text(self.canvas.winfo_width() // 2, 20, text = text, anchor = "n", tags = "status")
+
+    def close(self):
+        # A closed renderer never produces a result, and a pending submit would find the widgets gone
+        for after_id in (self.debounce_id, self.poll_id):
+            if after_id:
+                self.window.after_cancel(after_id)
+        self.debounce_id = self.poll_id = None
+        self.renderer.close()
+        self.window.destroy()
+
     def _reset_t_start(self, _evt = None, update = True):
         self.timestamp_start = self.app.profile.get_first_timestamp()
         # Show at most a month by default
@@ -280,18 +383,24 @@ class StatisticsWindow:
         self.update_graph()
 
 class App:    
-    def __init__(self, config: Config, data: Profile):
+    def __init__(self, config: Config, data: Profile, saver: BackgroundSaver | None = None):
         self.has_quit = False
         self.config = config
         self.window = tk.Tk()
         self.profile = data
+        self.saver = saver
+        self.scheduler: Scheduler | None = None
+        # Rendered statistics graphs, shared by every StatisticsWindow
+        self.graph_cache = LRUCache(config.graph_cache_size)
 
         self.timer_window = TimerWindow(self)
         self.window.title("OnTrack")
         self.window.geometry('800x600')
-        self.data_widgets : list[TimeWidget] = []
         self.category_panel = tk.Frame(master = self.window)
-        self.timer_panel = ScrollableFrame(self.window)
+        self.timer_panel = VirtualList(self.window, lambda root: TimeWidget(self, root), TimeWidget.update_program)
+        # Visible programs in display order, kept sorted incrementally as their times grow
+        self.order: list[ProgramData] = []
+        self.order_index: dict[str, int] = {}
         self.category_widgets = {
             category: CategoryInfoWidget(self, self.category_panel, category) for category in self.config.categories + [""]
         }
@@ -319,6 +428,7 @@ class App:
     def set_task(self, task: ProgramData):
         if self.has_quit: return
         self.timer_window.set_task(task)
+        self.timer_panel.refresh()
 
     def update_data(self, active_window: str | None):
         if self.has_quit: return
@@ -330,7 +440,13 @@ class App:
     def handle_close(self):
         if (self.has_quit): return
         self.has_quit = True
-        self.profile.save()
+        if self.scheduler:
+            self.scheduler.stop()
+        if self.saver:
+            self.saver.request(compact = True)
+            self.saver.close()
+        else:
+            self.profile.save(compact = True)
         if self.timer_window.window:
             self.timer_window.window.destroy()
         if self.window:
@@ -339,11 +455,24 @@ class App:
     
     def update_view(self):
         if self.has_quit: return
-        eligible_keys = [k for k in self.profile.programs.keys() if self.profile.programs[k].is_visible()]
-        keys = sorted(eligible_keys, key = lambda i: (self.profile.programs[i].sortkey()))
-        while len(self.data_widgets) < len(keys):
-            self.data_widgets.append(TimeWidget(self, self.timer_panel.frame))
-        while len(self.data_widgets) > len(keys):
-            self.data_widgets.pop().frame.destroy()
-        for k,widget in zip(keys,self.data_widgets):
-            widget.update_program(self.profile.programs[k])
+        changed, layout_changed = self.profile.take_changes()
+        if layout_changed:
+            self.rebuild_order()
+            return
+        for k in changed:
+            i = self.order_index.get(k)
+            if i is None: continue
+            # Time only grows, so a changed program can only move up the list
+            top = i
+            while top > 0 and self.order[top - 1].sortkey() > self.order[top].sortkey():
+                self.order[top - 1], self.order[top] = self.order[top], self.order[top - 1]
+                self.order_index[self.order[top].id] = top
+                top -= 1
+            self.order_index[k] = top
+            self.timer_panel.refresh_range(top, i)
+
+    def rebuild_order(self):
+        self.order = sorted((p for p in self.profile.programs.values() if p.is_visible()), key = lambda p: p.sortkey())
+        self.order_index = {p.id: i for i,p in enumerate(self.order)}
+        # Only the rows in view exist, the list rebinds its pooled TimeWidgets to these programs
+        self.timer_panel.set_items(self.order)
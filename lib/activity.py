@@ -0,0 +1,67 @@
+from bisect import insort
+import time
+from typing import Callable
+
+class ActivityMonitor:
+    '''Remembers only the monotonic time of the latest user input; idle and AFK state are derived from it'''
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.last_input = clock()
+
+    def record(self, *_):
+        '''Input hook target, a single timestamp store however many events arrive'''
+        self.last_input = self.clock()
+
+    def observe(self, timestamp: float):
+        '''Merge an input time reported by a polled source'''
+        if timestamp > self.last_input:
+            self.last_input = timestamp
+
+    def idle_time(self, now: float | None = None) -> float:
+        return max(0, (self.clock() if now is None else now) - self.last_input)
+
+    def is_afk(self, timeout: float, now: float | None = None) -> bool:
+        return self.idle_time(now) >= timeout
+
+class InputSource:
+    def poll(self, monitor: ActivityMonitor):
+        '''Push any input seen since the last poll into the monitor'''
+        pass
+
+class SystemInputSource(InputSource):
+    '''Asks Windows for the time of the last keyboard or mouse input, so no hooks are needed'''
+    def __init__(self):
+        import win32api
+        self.api = win32api
+
+    def poll(self, monitor: ActivityMonitor):
+        # Tick counts are milliseconds that wrap around every ~49.7 days
+        idle_ms = (self.api.GetTickCount() - self.api.GetLastInputInfo()) % 2**32
+        monitor.observe(time.monotonic() - idle_ms / 1000)
+
+class HookInputSource(InputSource):
+    '''Global keyboard hook plus pointer polling, for systems without a last input query'''
+    def __init__(self, monitor: ActivityMonitor, pointer: Callable[[], tuple[int, int]]):
+        import keyboard
+        self.pointer = pointer
+        self.pointer_pos = pointer()
+        keyboard.hook(monitor.record)
+
+    def poll(self, monitor: ActivityMonitor):
+        pos = self.pointer()
+        if pos != self.pointer_pos:
+            self.pointer_pos = pos
+            monitor.record()
+
+class FakeInputSource(InputSource):
+    '''Scripted input times, delivered once the monitor's clock reaches them'''
+    def __init__(self, inputs: list[float] | None = None):
+        self.inputs = sorted(inputs or [])
+
+    def press(self, timestamp: float):
+        insort(self.inputs, timestamp)
+
+    def poll(self, monitor: ActivityMonitor):
+        now = monitor.clock()
+        while self.inputs and self.inputs[0] <= now:
+            monitor.observe(self.inputs.pop(0))
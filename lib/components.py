@@ -1,33 +1,90 @@
 import tkinter as tk
-import ttkwidgets as ttkw
-from typing import Any
+from typing import Any, Callable
 
 from config import Config
 from data import Profile, ProgramData
 from lib.mathlib import get_tristate_from_selected 
 
-class ScrollableFrame(tk.Frame):
-    def __init__(self, parent: tk.Misc, cnf: dict[str,Any] = {}, **kwargs):
+class VirtualList(tk.Frame):
+    '''Scrollable list of equally tall rows where only the rows in view, plus `overscan` on each side,
+    exist as widgets. A pool of rows is rebound to items as the list scrolls.'''
+    def __init__(self, parent: tk.Misc, create_row: Callable[[tk.Misc], Any], bind_row: Callable[[Any, Any], None], overscan: int = 2, cnf: dict[str,Any] = {}, **kwargs):
         tk.Frame.__init__(self, parent, cnf, **kwargs)
-        self.canvas = tk.Canvas(self, background="#ffffff")
-        self.frame = tk.Frame(self.canvas, background="#ffffff")
+        self.create_row = create_row
+        self.bind_row = bind_row
+        self.overscan = overscan
+        self.items: list = []
+        self.pool: list[tuple[Any, int]] = [] # (row, canvas window id)
+        self.row_height = 0
+        self.first = 0
+
+        self.canvas = tk.Canvas(self, background="#ffffff", highlightthickness=0)
         self.vsb = tk.Scrollbar(self, orient="vertical", command=self.canvas.yview)
-        self.canvas.configure(yscrollcommand=self.vsb.set)
+        self.canvas.configure(yscrollcommand=self.onScroll)
 
         self.vsb.pack(side="right", fill="y")
         self.canvas.pack(side="left", fill="both", expand=True)
-        self.canvas.create_window((4,4), window=self.frame, anchor="n", tags="self.frame")
 
-        self.frame.bind("<Configure>", self.onFrameConfigure)
+        self.canvas.bind("<Configure>", self.onCanvasConfigure)
         self.canvas.bind_all("<MouseWheel>", self.onMouseWheel)
 
-    def onFrameConfigure(self, _evt):
-        '''Reset the scroll region to encompass the inner frame'''
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-    
+    def set_items(self, items: list):
+        self.items = items
+        self.ensure_pool()
+        self.canvas.configure(scrollregion=(0, 0, self.canvas.winfo_width(), len(items) * self.row_height))
+        self.layout(force = True)
+
+    def refresh(self):
+        '''Rebind the visible rows to their items, e.g. after the items changed in place'''
+        self.layout(force = True)
+
+    def refresh_range(self, lo: int, hi: int):
+        '''Rebind the rows showing items lo..hi (inclusive), skipping those out of view'''
+        for index in range(max(lo, self.first), min(hi + 1, self.first + len(self.pool), len(self.items))):
+            self.bind_row(self.pool[index - self.first][0], self.items[index])
+
+    def ensure_pool(self):
+        if not self.pool:
+            self.add_row()
+            self.update_idletasks()
+            self.row_height = max(1, self.pool[0][0].frame.winfo_reqheight())
+            self.canvas.configure(yscrollincrement=self.row_height)
+        needed = self.canvas.winfo_height() // self.row_height + 1 + 2 * self.overscan
+        while len(self.pool) < min(needed, max(1, len(self.items))):
+            self.add_row()
+
+    def add_row(self):
+        row = self.create_row(self.canvas)
+        window = self.canvas.create_window(0, 0, window=row.frame, anchor="nw", width=self.canvas.winfo_width(), state="hidden")
+        self.pool.append((row, window))
+
+    def layout(self, force: bool = False):
+        if not self.pool: return
+        first = max(0, int(self.canvas.canvasy(0)) // self.row_height - self.overscan)
+        if first == self.first and not force: return
+        self.first = first
+        for i, (row, window) in enumerate(self.pool):
+            index = first + i
+            if index < len(self.items):
+                self.bind_row(row, self.items[index])
+                self.canvas.coords(window, 0, index * self.row_height)
+                self.canvas.itemconfigure(window, state="normal")
+            else:
+                self.canvas.itemconfigure(window, state="hidden")
+
+    def onScroll(self, first, last):
+        '''Keep the scrollbar in sync and rebind rows that scrolled into view'''
+        self.vsb.set(first, last)
+        self.layout()
+
+    def onCanvasConfigure(self, evt):
+        '''Stretch the rows to the canvas width and grow the pool to fill its height'''
+        for _, window in self.pool:
+            self.canvas.itemconfigure(window, width=evt.width)
+        self.set_items(self.items)
+
     def onMouseWheel(self, evt):
         '''Handle mouse wheel events'''
-        print(f"Mouse wheel handling from scrollable frame, {evt.delta}")
         self.canvas.yview_scroll(-evt.delta // 120, "units")
 
 class ProgramSetSelector(tk.Frame):
@@ -49,6 +106,7 @@ class ProgramSetSelector(tk.Frame):
             if not p.is_visible(): continue
             total_per_category[p.category] += 1
 
+        import ttkwidgets as ttkw # only needed by the statistics window, slow to import
         self.tree = ttkw.CheckboxTreeview(self)
         self.tree.pack(fill="both", expand=True)
         self.tree.insert("", "end", "all", text="All", tags=(get_tristate_from_selected(len(selected_program_ids),sum(total_per_category.values())),))
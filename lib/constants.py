@@ -1,2 +1,4 @@
 GROUPING_OTHER = "other"
-GROUPING_OTHER_DISPLAY = "Other"
\ No newline at end of file
+GROUPING_OTHER_DISPLAY = "Other"
+GRAPH_DEBOUNCE_MS = 250
+GRAPH_POLL_MS = 50
\ No newline at end of file
@@ -1,12 +1,13 @@
 import math
 from matplotlib import axes, pyplot as plt
 from matplotlib.figure import Figure
+from matplotlib.patches import Patch
 
 from config import Config
-from data import Profile, ProgramData, get_time_key_pretty
-from lib.data_management import bucket_into_other, sort_dict_by_value
+from data import Profile, ProgramData, get_time_key_pretty, QUERY_GROUP_CATEGORY, QUERY_GROUP_PROGRAM, QUERY_GROUP_TOTAL
+from lib.reports import distribution
+from lib.timeseries import HOUR
 from lib.errors import GraphingError
-from lib.mathlib import add_to_list
 from lib.constants import GROUPING_OTHER, GROUPING_OTHER_DISPLAY
 import numpy as np
 
@@ -28,14 +29,22 @@ def shorten_name(name: str, max_len: int = 20, exceptions = {GROUPING_OTHER, GRO
         return name
     return name[:max_len]
 
-def plot_bar_timegraph(times, values, config: Config, title: str = "Time Graph", x_label: str = "Date", y_label: str = "Time Spent", labelx_rotation: float = 45) -> tuple[Figure, axes.Axes]:
-    (fig, ax) = plt.subplots()
+def prepare_figure(fig: Figure | None = None, layout: str | None = None) -> tuple[Figure, axes.Axes]:
+    '''Clear and reuse `fig` if given, otherwise create a new pyplot figure'''
+    if fig is None:
+        return plt.subplots(layout=layout)
+    fig.clear()
+    fig.set_layout_engine(layout)
+    return fig, fig.add_subplot()
+
+def plot_bar_timegraph(times, values, config: Config, title: str = "Time Graph", x_label: str = "Date", y_label: str = "Time Spent", labelx_rotation: float = 45, fig: Figure | None = None) -> tuple[Figure, axes.Axes]:
+    (fig, ax) = prepare_figure(fig)
     ax : plt.Axes = ax
     ax.bar(times, values)
     ax.set_title(title)
-    plt.xlabel(x_label)
-    plt.ylabel(y_label)
-    plt.xticks(rotation=labelx_rotation)
+    ax.set_xlabel(x_label)
+    ax.set_ylabel(y_label)
+    ax.tick_params(axis='x', labelrotation=labelx_rotation)
     ax.set_yticks(ax.get_yticks())
     ax.set_yticklabels([timespan_to_str(v) for v in ax.get_yticks()])
     fig.tight_layout()
@@ -51,7 +60,7 @@ def reduce_xaxis_labels(ax: axes.Axes, max_labels: int = 10):
             if i % (len(xlabels) // max_labels) != 0:
                 xlabels[i].set_visible(False)
 
-def plot_app_times(data: ProgramData, start: float | None = None, end: float | None = None, bucket_size: int = 60 * 60, num_buckets: float | None = None, only_show_days: bool = False) -> tuple[Figure, axes.Axes]:
+def plot_app_times(data: ProgramData, start: float | None = None, end: float | None = None, bucket_size: int = 60 * 60, num_buckets: float | None = None, only_show_days: bool = False, fig: Figure | None = None) -> tuple[Figure, axes.Axes]:
     if start is None:
         start = data.get_first_timestamp()
     if end is None:
@@ -60,10 +69,10 @@ def plot_app_times(data: ProgramData, start: float | None = None, end: float | N
         bucket_size = math.ceil((end - start) / num_buckets)
     hist = data.get_bucketed_time(start, end, bucket_size)
     times = [get_time_key_pretty(start + i * bucket_size, only_show_days) for i in range(len(hist))]
-    return plot_bar_timegraph(times, hist, data.config, f"Time Spent in {data.display_name}", "Date", "Time Spent")
+    return plot_bar_timegraph(times, hist, data.config, f"Time Spent in {data.display_name}", "Date", "Time Spent", fig=fig)
 
-def plot_tagged_series(x: list, data: dict[str, list[float]], config: Config, xlabel_rotation: float = 45) -> tuple[Figure, axes.Axes]:
-    fig, ax = plt.subplots(layout='constrained')
+def plot_tagged_series(x: list, data: dict[str, list[float]], config: Config, xlabel_rotation: float = 45, fig: Figure | None = None) -> tuple[Figure, axes.Axes]:
+    fig, ax = prepare_figure(fig, 'constrained')
     ax: plt.Axes = ax
 
     x_range = np.arange(len(x))
@@ -86,74 +95,56 @@ def plot_tagged_series(x: list, data: dict[str, list[float]], config: Config, xl
 
     return fig, ax
 
-def advanced_time_plot(x: list, x_subdivs: list[str], data: dict[str, tuple[str,list[float]]], config: Config, xlabel_rotation: float = 45):
-    fig, ax = plt.subplots(layout='constrained')
+def advanced_time_plot(x: list, x_subdivs: list[str], data: dict[str, tuple[str,list[float]]], config: Config, xlabel_rotation: float = 45, fig: Figure | None = None):
+    fig, ax = prepare_figure(fig, 'constrained')
     ax: plt.Axes = ax
 
-    effective_bar_count = len(x) * len(x_subdivs)
     width = 0.8 / len(x_subdivs)
+    names = list(data.keys())
 
-    # Each position in the xlabel is defined by a number of subdivisions (or categories)
-    # Each subdivision, simultaneously, has a number of programs with an associated time
-    segmented_data: list[dict[str,dict[str,float]]] = [{x_subdiv: {} for x_subdiv in x_subdivs} for _ in range(effective_bar_count)]
-    for pname, (cat, vals) in data.items():
-        for i, v in enumerate(vals):
-            segmented_data[i][cat][pname] = v
-        
-    # Now we just compactify the data to ignore categories, pretend each subdivision is an additional tick in the x axis
-    segmented_data_effective_bars : list[dict[str, float]] = []
-    for vals in segmented_data:
-        for subdiv in x_subdivs:
-            segmented_data_effective_bars.append(vals[subdiv])
-
-    effective_offsets = []
-    for i in range(len(x)):
-        for j in range(len(x_subdivs)):
-            effective_offsets.append(i + j * width)
+    # Each position in the xlabel is defined by a number of subdivisions (or categories), each of which is drawn
+    # as its own stacked bar. Bar i * len(x_subdivs) + j holds the programs of subdivision j at position i.
+    num_bars = len(x) * len(x_subdivs)
+    subdiv_index = {subdiv: j for j, subdiv in enumerate(x_subdivs)}
+    matrix = np.zeros((len(names), num_bars))
+    for p, (cat, vals) in enumerate(data.values()):
+        matrix[p, subdiv_index[cat]::len(x_subdivs)] = vals
+    effective_offsets = (np.arange(len(x))[:, None] + np.arange(len(x_subdivs))[None, :] * width).ravel()
 
-    highest_total = 0
-    for vals in segmented_data_effective_bars:
-        total = sum(vals.values())
-        if total > highest_total:
-            highest_total = total
+    # Lump the programs below the threshold of each bar into "other", which is drawn at the bottom
+    totals = matrix.sum(axis=0)
+    highest_total = totals.max(initial=0)
+    threshold = np.maximum(config.min_peak_fraction_bars * highest_total, config.min_piece_fraction_bars * totals)
+    small = matrix < threshold
+    other = np.where(small, matrix, 0).sum(axis=0)
+    kept = np.where(small, 0, matrix)
 
-    keys = list(data.keys()) + [GROUPING_OTHER]
-    sizes_per_program = {pname: [] for pname in keys}
-    offsets_per_program = {pname: [] for pname in keys}
-    bottoms_per_program = {pname: [] for pname in keys}
-    # Then, we need to sort each individual subdivision and lump certain programs into a new "other" category
-    for i,vals in enumerate(segmented_data_effective_bars):
-        threshold = max(config.min_peak_fraction_bars * highest_total, config.min_piece_fraction_bars * sum(vals.values()))
-        bucketed = bucket_into_other(vals, threshold, GROUPING_OTHER)
-        # Reverse is false because we want to create the bar plot starting from the bottom
-        sorted_keys, sorted_vals = sort_dict_by_value(bucketed, reverse=False, force_min_key=GROUPING_OTHER)
-        bot = 0
-        for pname, val in zip(sorted_keys, sorted_vals):
-            if val == 0:
-                continue
-            sizes_per_program[pname].append(val)
-            offsets_per_program[pname].append(effective_offsets[i])
-            bottoms_per_program[pname].append(bot)
-            bot += val
+    # Stack the remaining programs from the smallest up, ties keep the program order
+    order = np.argsort(kept, axis=0, kind='stable')
+    sorted_vals = np.take_along_axis(kept, order, axis=0)
+    bottoms = np.empty_like(kept)
+    np.put_along_axis(bottoms, order, other + np.cumsum(sorted_vals, axis=0) - sorted_vals, axis=0)
 
-    prog_colors = {}
-    prog_totals = {pname: sum(sizes) for pname, sizes in sizes_per_program.items()}
+    # Colors go to the programs with the most time shown first
+    program_totals = kept.sum(axis=1)
+    prog_colors = [""] * len(names)
     color_gen = config.color_generator()
-    for pname in sort_dict_by_value(prog_totals, reverse=True)[0]:
-        if pname == GROUPING_OTHER:
-            prog_colors[pname] = config.get_color("miscellaneous")
-            continue
-        prog_colors[pname] = next(color_gen)
+    for p in np.argsort(-program_totals, kind='stable'):
+        prog_colors[p] = next(color_gen)
+    other_color = config.get_color("miscellaneous")
 
-    for pname in keys:
-        offsets = offsets_per_program[pname]
-        if (len(offsets) == 0):
-            continue
-        sizes = sizes_per_program[pname]
-        bottoms = bottoms_per_program[pname]
-        color = prog_colors[pname]
-        rects = ax.bar(offsets, sizes, width, bottoms, label=shorten_name(pname), color=color)
-        # ax.bar_label(rects, padding=3, rotation=90, fmt=lambda x: timespan_to_str(x))
+    # A single bar call for every segment, with the legend built to match one entry per program
+    programs, bars = np.nonzero(kept > 0)
+    other_bars = np.nonzero(other > 0)[0]
+    offsets = np.concatenate((effective_offsets[bars], effective_offsets[other_bars]))
+    sizes = np.concatenate((kept[programs, bars], other[other_bars]))
+    bottom = np.concatenate((bottoms[programs, bars], np.zeros(len(other_bars))))
+    colors = [prog_colors[p] for p in programs] + [other_color] * len(other_bars)
+    if len(sizes):
+        ax.bar(offsets, sizes, width, bottom, color=colors)
+    handles = [Patch(color=prog_colors[p], label=shorten_name(names[p])) for p in np.unique(programs)]
+    if len(other_bars):
+        handles.append(Patch(color=other_color, label=shorten_name(GROUPING_OTHER)))
 
     x_range = np.arange(len(x))
     ax.set_ylabel('Time Spent')
@@ -161,53 +152,52 @@ def advanced_time_plot(x: list, x_subdivs: list[str], data: dict[str, tuple[str,
     ax.set_xticks(x_range + (0.4 - width / 2), x, rotation=xlabel_rotation)
     ax.set_yticks(ax.get_yticks())
     ax.set_yticklabels([timespan_to_str(v) for v in ax.get_yticks()])
-    ax.legend()
+    ax.legend(handles=handles)
     
     reduce_xaxis_labels(ax, config.max_plot_labels)
 
     return fig, ax
 
-def plot_category_times(data: Profile, config: Config, start: float | None = None, end: float | None = None, bucket_size: int = 60 * 60, num_buckets: float | None = None, only_show_days: bool = False, label_xrotation: float = 45, programs: list[ProgramData] = []) -> tuple[Figure, axes.Axes]:
+def plot_category_times(data: Profile, config: Config, start: float | None = None, end: float | None = None, bucket_size: int = 60 * 60, num_buckets: float | None = None, only_show_days: bool = False, label_xrotation: float = 45, programs: list[ProgramData] = [], fig: Figure | None = None) -> tuple[Figure, axes.Axes]:
     if start is None:
         start = data.get_first_timestamp()
     if end is None:
         end = data.get_last_timestamp() + bucket_size
     if num_buckets is not None:
         bucket_size = math.ceil((end - start) / num_buckets)
-    if len(programs) == 0:
-        programs = [p for p in data.programs.values() if p.is_visible()]
     num_buckets = math.ceil((end - start) / bucket_size)
-    values = {category: [0 for _ in range(num_buckets)] for category in config.categories}    
-    for prog in programs:
-        add_to_list(values[prog.category], prog.get_bucketed_time(start, end, bucket_size))
-    times = [get_time_key_pretty(start + i * bucket_size, only_show_days) for i in range(num_buckets)]
-    return plot_tagged_series(times, values, config, label_xrotation)
+    categories, matrix = data.query(start, end, bucket_size, QUERY_GROUP_CATEGORY, programs)
+    values = {category: row for category, row in zip(categories, matrix)}
+    times = [get_time_key_pretty(start + i * bucket_size, only_show_days, bucket_size < HOUR) for i in range(num_buckets)]
+    return plot_tagged_series(times, values, config, label_xrotation, fig)
 
-def plot_mixed_times(data: Profile, config: Config, start: float | None = None, end: float | None = None, bucket_size: int = 60, num_buckets: float | None = None, only_show_days: bool = False, label_xrotation: float = 45, programs: list[ProgramData] = []) -> tuple[Figure, axes.Axes]:
+def plot_mixed_times(data: Profile, config: Config, start: float | None = None, end: float | None = None, bucket_size: int = 60, num_buckets: float | None = None, only_show_days: bool = False, label_xrotation: float = 45, programs: list[ProgramData] = [], fig: Figure | None = None) -> tuple[Figure, axes.Axes]:
     if start is None:
         start = data.get_first_timestamp()
     if end is None:
         end = data.get_last_timestamp() + 1
     if num_buckets is not None:
         bucket_size = math.ceil((end - start) / num_buckets)
-    if len(programs) == 0:
-        programs = [p for p in data.programs.values() if p.is_visible()]
     num_buckets = math.ceil((end - start) / bucket_size)
-    values = [0 for _ in range(num_buckets)]
-    for prog in programs:
-        add_to_list(values, prog.get_bucketed_time(start, end, bucket_size))
-    times = [get_time_key_pretty(start + i * bucket_size, only_show_days) for i in range(num_buckets)]
-    return plot_bar_timegraph(times, values, config, "Activity Over Time", labelx_rotation=label_xrotation)
+    _, matrix = data.query(start, end, bucket_size, QUERY_GROUP_TOTAL, programs)
+    values = matrix[0]
+    times = [get_time_key_pretty(start + i * bucket_size, only_show_days, bucket_size < HOUR) for i in range(num_buckets)]
+    return plot_bar_timegraph(times, values, config, "Activity Over Time", labelx_rotation=label_xrotation, fig=fig)
+
+def fit_timestep(timestamp_start: float, timestamp_end: float, timestep: float, max_buckets: int) -> float:
+    '''The smallest multiple of `timestep` that splits the range into at most `max_buckets` buckets, so long
+    ranges are drawn with wider bars instead of being refused'''
+    num_buckets = math.ceil((timestamp_end - timestamp_start) / timestep)
+    return timestep * max(1, math.ceil(num_buckets / max(max_buckets, 1)))
 
-def build_activity_graph(profile: Profile, config: Config, timestamp_start: float, timestamp_end: float, selected_timestep: float, split_by_categories: bool = True, show_individual_programs: bool = False, selected_programs: list[ProgramData] = []) -> tuple[Figure, axes.Axes]:
+def build_activity_graph(profile: Profile, config: Config, timestamp_start: float, timestamp_end: float, selected_timestep: float, split_by_categories: bool = True, show_individual_programs: bool = False, selected_programs: list[ProgramData] = [], fig: Figure | None = None) -> tuple[Figure, axes.Axes]:
     if len(selected_programs) == 0:
         selected_programs = [p for p in profile.programs.values() if p.is_visible()]
     if timestamp_end <= timestamp_start:
         raise GraphingError("End time must be after start time")
+    selected_timestep = fit_timestep(timestamp_start, timestamp_end, selected_timestep, config.max_plot_buckets)
     show_time = selected_timestep < 60 * 60 * 24
     num_buckets = math.ceil((timestamp_end - timestamp_start) / selected_timestep)
-    if num_buckets > config.max_plot_buckets:
-        raise GraphingError(f"Too many buckets: ({num_buckets} > {config.max_plot_buckets})")
     # <= 4 -> 45 degrees
     # 6 buckets - 60 degrees
     # 8 buckets - 67.5 degrees
@@ -215,25 +205,25 @@ def build_activity_graph(profile: Profile, config: Config, timestamp_start: floa
     label_rotation = max(90 - (180 / num_buckets), 45)
     if not show_individual_programs:
         if split_by_categories:
-            return plot_category_times(profile, config, timestamp_start, timestamp_end, selected_timestep, only_show_days=not show_time, programs = selected_programs, label_xrotation=label_rotation)
-        return plot_mixed_times(profile, config, timestamp_start, timestamp_end, selected_timestep, only_show_days=not show_time, programs = selected_programs, label_xrotation=label_rotation)
+            return plot_category_times(profile, config, timestamp_start, timestamp_end, selected_timestep, only_show_days=not show_time, programs = selected_programs, label_xrotation=label_rotation, fig=fig)
+        return plot_mixed_times(profile, config, timestamp_start, timestamp_end, selected_timestep, only_show_days=not show_time, programs = selected_programs, label_xrotation=label_rotation, fig=fig)
     else:
-        formatted_data = {}
+        _, matrix = profile.query(timestamp_start, timestamp_end, selected_timestep, QUERY_GROUP_PROGRAM, selected_programs)
         categories = [""]
         if split_by_categories:
-            formatted_data = {prog.display_name: (prog.category, prog.get_bucketed_time(timestamp_start, timestamp_end, selected_timestep)) for prog in selected_programs}
+            formatted_data = {prog.display_name: (prog.category, row) for prog, row in zip(selected_programs, matrix)}
             categories = config.categories
         else:
-            formatted_data = {prog.display_name: ("", prog.get_bucketed_time(timestamp_start, timestamp_end, selected_timestep)) for prog in selected_programs}
-        x_labels = [get_time_key_pretty(timestamp_start + i * selected_timestep, not show_time) for i in range(num_buckets)]
-        return advanced_time_plot(x_labels, categories, formatted_data, config, label_rotation)
+            formatted_data = {prog.display_name: ("", row) for prog, row in zip(selected_programs, matrix)}
+        x_labels = [get_time_key_pretty(timestamp_start + i * selected_timestep, not show_time, selected_timestep < HOUR) for i in range(num_buckets)]
+        return advanced_time_plot(x_labels, categories, formatted_data, config, label_rotation, fig)
 
 ##############
 # PIE CHARTS #
 ##############
 
-def plot_pie_chart(keys: list[str], values: list[float], config: Config, title: str = "Time Spent by Category") -> tuple[Figure, axes.Axes]:
-    fig, ax = plt.subplots()
+def plot_pie_chart(keys: list[str], values: list[float], config: Config, title: str = "Time Spent by Category", fig: Figure | None = None) -> tuple[Figure, axes.Axes]:
+    fig, ax = prepare_figure(fig)
     misc_color_gen = config.color_generator()
     colors = []
     explodes = []
@@ -257,21 +247,12 @@ def plot_pie_chart(keys: list[str], values: list[float], config: Config, title:
     ax.set_title(title)
     return fig, ax
 
-def build_pie_chart(profile: Profile, config: Config, timestamp_start: float, timestamp_end: float, split_by_categories: bool = True, selected_programs: list[ProgramData] = []) -> tuple[Figure, axes.Axes]:
+def build_pie_chart(profile: Profile, config: Config, timestamp_start: float, timestamp_end: float, split_by_categories: bool = True, selected_programs: list[ProgramData] = [], fig: Figure | None = None) -> tuple[Figure, axes.Axes]:
     if len(selected_programs) == 0:
         selected_programs = [p for p in profile.programs.values() if p.is_visible()]
     if timestamp_end <= timestamp_start:
         raise GraphingError("End time must be after start time")
     
-    if split_by_categories:
-        data = {category: 0 for category in config.categories}
-        for prog in selected_programs:
-            data[prog.category] += prog.get_timeframe_time(timestamp_start, timestamp_end)
-    else:
-        data = {prog.display_name: prog.get_timeframe_time(timestamp_start, timestamp_end) for prog in selected_programs}
-
-    total = sum(data.values())
-    data = bucket_into_other(data, config.min_piece_fraction_pie * total)
-    keys, values = sort_dict_by_value(data, reverse=False)
-    return plot_pie_chart(keys, values, config, f"Task Distribution from {get_time_key_pretty(timestamp_start, True)} to {get_time_key_pretty(timestamp_end, True)}")
+    keys, values = distribution(profile, config, timestamp_start, timestamp_end, split_by_categories, selected_programs)
+    return plot_pie_chart(keys, values, config, f"Task Distribution from {get_time_key_pretty(timestamp_start, True)} to {get_time_key_pretty(timestamp_end, True)}", fig)
     
\ No newline at end of file
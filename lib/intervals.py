@@ -0,0 +1,183 @@
+from array import array
+import json
+import os
+from typing import Callable
+
+import numpy as np
+
+from lib.timeseries import hour_index, hour_to_timestamp
+
+FOCUS_LOG_FILE = "focus.log"
+# Samples closer than this are treated as one contiguous interval, absorbing clock jitter
+MERGE_TOLERANCE = 1.0
+
+class FocusLog:
+    '''Append-only record of focus intervals (program, start, end, afk), with back-to-back samples
+    of the same program merged into one interval. Recent intervals answer sub-hour queries;
+    hourly series are credited from them in batches.'''
+    def __init__(self, retention: float):
+        self.retention = retention
+        self.names: list[str] = []
+        self.name_index: dict[str, int] = {}
+        self.program = array('I')
+        self.start = array('d')
+        self.end = array('d')
+        self.afk = array('b')
+        # Intervals before `flushed` have been credited in full, and the one at `flushed` up to `flushed_time`
+        self.flushed = 0
+        self.flushed_time = 0.0
+        # Intervals from `saved` on still need to be written; the last written one may have grown since
+        self.saved = 0
+        self.saved_end = 0.0
+
+    def __len__(self):
+        return len(self.start)
+
+    def add(self, name: str, start: float, end: float, afk: bool):
+        if end <= start:
+            return
+        index = self.program_index(name)
+        if len(self.start) and self.program[-1] == index and self.afk[-1] == afk and abs(start - self.end[-1]) <= MERGE_TOLERANCE:
+            self.end[-1] = max(self.end[-1], end)
+            return
+        self.append(index, start, end, afk)
+
+    def program_index(self, name: str) -> int:
+        index = self.name_index.get(name)
+        if index is None:
+            index = self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    def append(self, index: int, start: float, end: float, afk: bool):
+        self.program.append(index)
+        self.start.append(start)
+        self.end.append(end)
+        self.afk.append(afk)
+
+    def flush(self, credit: Callable[[str, bool, float, float], None]):
+        '''Hand every uncredited stretch to `credit(name, afk, start, end)`, split at local hour boundaries'''
+        for i in range(self.flushed, len(self.start)):
+            t = max(self.start[i], self.flushed_time) if i == self.flushed else self.start[i]
+            end = self.end[i]
+            name = self.names[self.program[i]]
+            while t < end:
+                boundary = min(end, hour_to_timestamp(hour_index(t) + 1))
+                credit(name, bool(self.afk[i]), t, boundary)
+                t = boundary
+        if len(self.start):
+            self.flushed = len(self.start) - 1
+            self.flushed_time = self.end[-1]
+
+    def take_unsaved(self) -> list[list]:
+        '''Records to append to the log file since the last call'''
+        n = len(self.start)
+        if self.saved >= n or (self.saved == n - 1 and self.end[-1] == self.saved_end):
+            return []
+        records = [[self.names[self.program[i]], self.start[i], self.end[i], self.afk[i]] for i in range(self.saved, n)]
+        self.saved = n - 1
+        self.saved_end = self.end[-1]
+        return records
+
+    def prune(self, now: float):
+        '''Forget intervals that ended before the retention window, once they are credited and saved'''
+        cutoff = now - self.retention
+        keep = min(self.flushed, self.saved)
+        drop = 0
+        while drop < keep and self.end[drop] < cutoff:
+            drop += 1
+        if drop == 0:
+            return
+        del self.program[:drop]
+        del self.start[:drop]
+        del self.end[:drop]
+        del self.afk[:drop]
+        self.flushed -= drop
+        self.saved -= drop
+
+    def copy(self) -> "FocusLog":
+        log = FocusLog(self.retention)
+        log.names = list(self.names)
+        log.name_index = dict(self.name_index)
+        log.program = array('I', self.program)
+        log.start = array('d', self.start)
+        log.end = array('d', self.end)
+        log.afk = array('b', self.afk)
+        return log
+
+    def first_timestamp(self) -> float | None:
+        return self.start[0] if len(self.start) else None
+
+    def query(self, names: list[str], groups: list[int], num_groups: int, edges: np.ndarray, count_afk: list[bool]) -> np.ndarray:
+        '''Seconds of focus per group between consecutive `edges`. AFK stretches only count for programs
+        whose `count_afk` flag is set, mirroring how hourly time is credited.'''
+        result = np.zeros((num_groups, len(edges) - 1))
+        if not len(self.start) or not names:
+            return result
+        rows = np.full(len(self.names), -1)
+        afk_counts = np.zeros(len(self.names), dtype=bool)
+        for name, g, c in zip(names, groups, count_afk):
+            if name in self.name_index:
+                rows[self.name_index[name]] = g
+                afk_counts[self.name_index[name]] = c
+        program = np.frombuffer(self.program, dtype=np.uint32)
+        afk = np.frombuffer(self.afk, dtype=np.int8).astype(bool)
+        # Shift to the query origin so the ramp sums below keep their precision
+        origin = edges[0]
+        start = np.frombuffer(self.start) - origin
+        end = np.frombuffer(self.end) - origin
+        x = edges - origin
+        row = rows[program]
+        keep = (row >= 0) & (~afk | afk_counts[program]) & (end > x[0]) & (start < x[-1])
+        for g in np.unique(row[keep]):
+            sel = keep & (row == g)
+            # Time covered before x is the sum of ramps max(0, x - start) - max(0, x - end)
+            covered = ramp_sum(np.sort(start[sel]), x) - ramp_sum(np.sort(end[sel]), x)
+            result[g] += np.diff(covered)
+        return result
+
+    @staticmethod
+    def load(path: str, retention: float, now: float) -> "FocusLog":
+        log = FocusLog(retention)
+        if not os.path.exists(path):
+            return log
+        cutoff = now - retention
+        records = []
+        with open(path) as f:
+            for i, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"[WARNING] ignoring corrupt focus log line {i + 1} in {path}")
+                    break
+                if records and records[-1][:2] == record[:2]:
+                    # The same interval written again after it grew
+                    records[-1] = record
+                else:
+                    records.append(record)
+        kept = [r for r in records if r[2] >= cutoff]
+        for name, start, end, afk in kept:
+            # Not merged, so the last interval keeps the start it will be rewritten under
+            log.append(log.program_index(name), start, end, afk)
+        if len(log):
+            log.flushed = log.saved = len(log) - 1
+            log.flushed_time = log.saved_end = log.end[-1]
+        if len(kept) < len(records):
+            rewrite_intervals(path, kept)
+        return log
+
+def ramp_sum(sorted_values: np.ndarray, x: np.ndarray) -> np.ndarray:
+    '''sum(max(0, x - v) for v in sorted_values) for every x'''
+    prefix = np.concatenate(([0.0], np.cumsum(sorted_values)))
+    k = np.searchsorted(sorted_values, x)
+    return k * x - prefix[k]
+
+def append_intervals(path: str, records: list[list]):
+    with open(path, "a") as f:
+        f.writelines(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+
+def rewrite_intervals(path: str, records: list[list]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+    os.replace(tmp_path, path)
@@ -0,0 +1,55 @@
+import json
+import os
+
+# A journal is a newline-delimited JSON file. The first line is a header naming the
+# snapshot it extends ({"journal_id": n}); each following line is one saved batch of changes.
+
+def read_journal(path: str) -> tuple[int | None, list[dict]]:
+    '''Return the journal id and its entries, or (None, []) if there is no readable journal'''
+    if not os.path.exists(path):
+        return None, []
+    journal_id = None
+    entries = []
+    with open(path) as f:
+        for i, line in enumerate(f):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from an interrupted write, everything before it is still valid
+                print(f"[WARNING] ignoring corrupt journal line {i + 1} in {path}")
+                break
+            if i == 0:
+                journal_id = entry.get("journal_id")
+            else:
+                entries.append(entry)
+    return journal_id, entries
+
+def reset_journal(path: str, journal_id: int):
+    with open(path, "w") as f:
+        f.write(json.dumps({"journal_id": journal_id}) + "\n")
+
+def append_journal(path: str, entry: dict):
+    with open(path, "a") as f:
+        f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def merge_entries(entry: dict, other: dict):
+    '''Fold a later journal entry into an earlier one that has not been written yet'''
+    if "time" in other:
+        entry.setdefault("time", []).extend(other["time"])
+    if "meta" in other:
+        entry.setdefault("meta", {}).update(other["meta"])
+    if "selected_program" in other:
+        entry["selected_program"] = other["selected_program"]
+
+def write_atomic(path: str, data: dict, backup_path: str | None = None):
+    '''Write JSON to a temporary file and swap it in, keeping the previous file as a backup'''
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent = 2, default = lambda o: o.to_dict())
+        f.flush()
+        os.fsync(f.fileno())
+    if backup_path and os.path.exists(path):
+        os.replace(path, backup_path)
+    os.replace(tmp_path, path)
@@ -1,21 +1,86 @@
-import pygetwindow as gw
+from collections import OrderedDict
+
 import psutil as ps
-import win32process as wproc
 
-def get_active_pid() -> int | None:
+def get_active_window() -> tuple[int, int] | None:
+    '''Handle and process id of the foreground window'''
+    import pygetwindow as gw
+    import win32process as wproc
     win = gw.getActiveWindow()
     if not win:
         return
     tId, pId = wproc.GetWindowThreadProcessId(win._hWnd)
-    return pId
+    return win._hWnd, pId
+
+def get_active_pid() -> int | None:
+    active = get_active_window()
+    return active[1] if active else None
+
+def format_proc_name(pname: str, dropExtension: bool) -> str:
+    last_dot = pname.find(".")
+    if (dropExtension and last_dot > 0): # if a file starts with a ".", or doesn't contain a "." keep it as-is
+        pname = pname[:last_dot]
+    return pname
 
 def try_get_proc_name(pid, dropExtension):
     try:
-        proc = ps.Process(pid)
-        pname = proc.name()
-        last_dot = pname.find(".")
-        if (dropExtension and last_dot > 0): # if a file starts with a ".", or doesn't contain a "." keep it as-is
-            pname = pname[:last_dot]
-        return pname
+        return format_proc_name(ps.Process(pid).name(), dropExtension)
     except:
-        return None
\ No newline at end of file
+        return None
+
+class ProcessNameCache:
+    '''LRU cache of process names keyed by (pid, create time), so a reused pid never resolves to a stale name'''
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.names: OrderedDict[tuple[int, float], str] = OrderedDict()
+        # A window cannot outlive its process, so a known (window, pid) pair needs no create time lookup
+        self.windows: OrderedDict[tuple[int, int], tuple[int, float]] = OrderedDict()
+        # Only the (window, pid) fast path counts as a hit; a name found after querying the process's
+        # create time still paid for that query and is counted in process_hits
+        self.hits = 0
+        self.process_hits = 0
+        self.misses = 0
+
+    def get_name(self, pid: int, dropExtension: bool, window: int | None = None) -> str | None:
+        key = self.windows.get((window, pid)) if window is not None else None
+        if key is not None and key in self.names:
+            self.hits += 1
+            self.names.move_to_end(key)
+            name = self.names[key]
+        else:
+            try:
+                proc = ps.Process(pid)
+                key = (pid, proc.create_time())
+                name = self.names.get(key)
+                if name is None:
+                    name = proc.name()
+                    self.misses += 1
+                else:
+                    self.process_hits += 1
+            except:
+                return None
+            self.remember(self.names, key, name)
+        if window is not None:
+            self.remember(self.windows, (window, pid), key)
+        return format_proc_name(name, dropExtension)
+
+    def get_active_name(self, dropExtension: bool) -> str | None:
+        active = get_active_window()
+        if active is None:
+            return None
+        window, pid = active
+        return self.get_name(pid, dropExtension, window)
+
+    def remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_size:
+            cache.popitem(last = False)
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.process_hits + self.misses
+        return self.hits / lookups if lookups else 0
+
+    def clear(self):
+        self.names.clear()
+        self.windows.clear()
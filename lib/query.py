@@ -0,0 +1,44 @@
+import numpy as np
+
+from lib.timeseries import ROLLUP_TIERS, HourlySeries, bucket_hour_bounds
+
+def series_prefix(series: HourlySeries) -> np.ndarray:
+    '''Zero-copy view of the series range index (see HourlySeries.prefix_sums)'''
+    return np.frombuffer(series.prefix_sums(), dtype=np.float64)
+
+def select_rollup(bounds: np.ndarray) -> tuple[str, np.ndarray] | None:
+    '''Pick the coarsest rollup tier whose units start on every bound but the last, which may be clipped
+    to the end of the range. Returns the tier and the bounds expressed in its units.'''
+    if len(bounds) < 3:
+        return None
+    for tier, (to_unit, unit_start) in ROLLUP_TIERS.items():
+        units = [to_unit(int(b)) for b in bounds[:-1]]
+        if all(unit_start(u) == b for u, b in zip(units, bounds[:-1])):
+            return tier, np.array(units, dtype=np.int64)
+    return None
+
+def bucket_series(series: HourlySeries, bounds: np.ndarray, rollup: tuple[str, np.ndarray] | None = None) -> np.ndarray:
+    '''Bucket totals of a single series for the hour bounds produced by bucket_hour_bounds.
+    With a rollup from select_rollup, all but the last bucket are read from that tier.'''
+    if series.is_empty():
+        return np.zeros(len(bounds) - 1)
+    if rollup is not None:
+        tier, units = rollup
+        head = bucket_series(series.rollup(tier), units)
+        return np.append(head, series.range_sum(int(bounds[-2]), int(bounds[-1])))
+    prefix = series_prefix(series)
+    idx = np.clip(bounds - series.base, 0, len(series))
+    return np.diff(prefix[idx])
+
+def query_bounds(start: float, end: float, step: float) -> np.ndarray:
+    return np.array(bucket_hour_bounds(start, end, step), dtype=np.int64)
+
+def query_series(series: list[HourlySeries], groups: list[int], num_groups: int, bounds: np.ndarray) -> np.ndarray:
+    '''Bucket every series between the given hour bounds, summing series into their group rows'''
+    result = np.zeros((num_groups, len(bounds) - 1))
+    rollup = select_rollup(bounds)
+    for s, g in zip(series, groups):
+        if s.is_empty() or s.last_hour() < bounds[0] or s.first_hour() >= bounds[-1]:
+            continue
+        result[g] += bucket_series(s, bounds, rollup)
+    return result
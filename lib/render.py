@@ -0,0 +1,83 @@
+from threading import Condition, Thread
+from typing import Callable
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+class RenderResult:
+    def __init__(self, generation: int, size: tuple[int, int] = (0, 0), rgba: bytes = b"", error: Exception | None = None):
+        self.generation = generation
+        self.size = size
+        self.rgba = rgba
+        self.error = error
+
+class GraphRenderer:
+    '''Builds and rasterizes figures on a worker thread. Only the latest request is worked on,
+    anything it supersedes is dropped at the next checkpoint.'''
+    def __init__(self, dpi: int = 100):
+        self.figure = Figure(dpi = dpi)
+        FigureCanvasAgg(self.figure)
+        self.generation = 0
+        self.job: tuple[int, Callable[[Figure], None], tuple[int, int]] | None = None
+        self.result: RenderResult | None = None
+        self.closed = False
+        self.condition = Condition()
+        self.thread = Thread(target = self.run, name = "GraphRenderer", daemon = True)
+        self.thread.start()
+
+    def submit(self, build: Callable[[Figure], None], size: tuple[int, int]) -> int:
+        '''Queue `build(figure)` to be rendered at `size` pixels, replacing any queued request'''
+        with self.condition:
+            self.generation += 1
+            self.job = (self.generation, build, size)
+            self.condition.notify_all()
+            return self.generation
+
+    def cancel(self):
+        '''Drop the queued request and whatever is being rendered'''
+        with self.condition:
+            self.generation += 1
+            self.job = None
+
+    def superseded(self, generation: int) -> bool:
+        return self.closed or generation != self.generation
+
+    def take_result(self) -> RenderResult | None:
+        '''The latest finished render, if any; safe to call from the Tk thread'''
+        with self.condition:
+            result, self.result = self.result, None
+            return result
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.job is None and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                generation, build, size = self.job
+                self.job = None
+            result = self.render(generation, build, size)
+            with self.condition:
+                if result and not self.superseded(generation):
+                    self.result = result
+
+    def render(self, generation: int, build: Callable[[Figure], None], size: tuple[int, int]) -> RenderResult | None:
+        width, height = max(size[0], 1), max(size[1], 1)
+        try:
+            self.figure.set_size_inches(width / self.figure.dpi, height / self.figure.dpi)
+            build(self.figure)
+            if self.superseded(generation):
+                return None
+            self.figure.canvas.draw()
+            if self.superseded(generation):
+                return None
+            rgba = bytes(self.figure.canvas.buffer_rgba())
+            return RenderResult(generation, self.figure.canvas.get_width_height(), rgba)
+        except Exception as e:
+            return RenderResult(generation, error = e)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,129 @@
+import heapq
+import json
+import random
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+from data import Profile
+from lib.activity import FakeInputSource
+from lib.samplers import Sampler
+from lib.scheduler import Scheduler
+from lib.tracking import Tracker, schedule_tracking
+
+class TraceEvent(NamedTuple):
+    '''From `timestamp` on, `process` is in front (None for no window); `input` marks user activity at that instant'''
+    timestamp: float
+    process: str | None
+    input: bool = False
+
+class ReplaySampler(Sampler):
+    '''Plays back a trace of events; the clock only moves when the replay loop advances it'''
+    def __init__(self, events: Iterable[TraceEvent]):
+        self.events = iter(events)
+        self.pending = next(self.events, None)
+        self.clock = self.pending.timestamp if self.pending else 0
+        self.end = self.clock
+        self.current: str | None = None
+        super().__init__(FakeInputSource())
+
+    def advance(self, t: float):
+        self.clock = max(self.clock, t)
+        while self.pending is not None and self.pending.timestamp <= self.clock:
+            event = self.pending
+            self.current = event.process
+            if event.input:
+                self.input_source.press(event.timestamp)
+            self.end = event.timestamp
+            self.pending = next(self.events, None)
+
+    def exhausted(self) -> bool:
+        return self.pending is None
+
+    def monotonic(self) -> float:
+        return self.clock
+
+    def time(self) -> float:
+        return self.clock
+
+    def foreground_name(self) -> str | None:
+        return self.current
+
+class ReplayLoop:
+    '''Stands in for the Tk root: runs `after` callbacks in virtual time, as fast as they can execute'''
+    def __init__(self, sampler: ReplaySampler):
+        self.sampler = sampler
+        self.queue: list[tuple[float, int, Callable[[], None]]] = []
+        self.cancelled: set[int] = set()
+        self.counter = 0
+
+    def after(self, ms: int, callback: Callable[[], None]) -> str:
+        self.counter += 1
+        heapq.heappush(self.queue, (self.sampler.clock + ms / 1000, self.counter, callback))
+        return str(self.counter)
+
+    def after_cancel(self, after_id: str):
+        self.cancelled.add(int(after_id))
+
+    def mainloop(self):
+        while self.queue:
+            due, counter, callback = heapq.heappop(self.queue)
+            if counter in self.cancelled:
+                self.cancelled.discard(counter)
+                continue
+            if self.sampler.exhausted() and due > self.sampler.end:
+                break
+            self.sampler.advance(due)
+            callback()
+
+def replay(profile: Profile, events: Iterable[TraceEvent]) -> Tracker:
+    '''Run the tracking pipeline over a trace, crediting its time to `profile`'''
+    sampler = ReplaySampler(events)
+    tracker = Tracker(profile.config, profile, sampler)
+    scheduler = Scheduler(ReplayLoop(sampler), clock = sampler.monotonic)
+    schedule_tracking(scheduler, tracker)
+    scheduler.run()
+    profile.flush_focus_log()
+    return tracker
+
+def trace_totals(events: Iterable[TraceEvent], afk_timeout: float) -> dict[str, float]:
+    '''Present time per process in a trace, worked out directly from the events: the user counts as present
+    until `afk_timeout` after each input. What a replay credits to AFK-sensitive programs should match this.'''
+    totals: dict[str, float] = {}
+    last_input: float | None = None
+    previous: TraceEvent | None = None
+    for event in events:
+        if previous is not None and previous.process is not None and last_input is not None:
+            present = min(event.timestamp, last_input + afk_timeout) - previous.timestamp
+            totals[previous.process] = totals.get(previous.process, 0) + max(0, present)
+        if event.input:
+            last_input = event.timestamp
+        previous = event
+    return totals
+
+def read_trace(path: str) -> Iterator[TraceEvent]:
+    '''Stream a newline-delimited JSON trace, one [timestamp, process, input] array per line'''
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield TraceEvent(*json.loads(line))
+
+def write_trace(path: str, events: Iterable[TraceEvent]):
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(list(event)) + "\n")
+
+def synthetic_trace(start: float, duration: float, programs: list[str], seed: int = 0,
+        mean_focus: float = 120, mean_input_gap: float = 20, afk_chance: float = 0.02, mean_afk: float = 900) -> Iterator[TraceEvent]:
+    '''Random focus switches with bursts of input and occasional AFK stretches, ending with a closing event'''
+    rng = random.Random(seed)
+    t = start
+    end = start + duration
+    process = rng.choice(programs)
+    while t < end:
+        yield TraceEvent(t, process, True)
+        if rng.random() < afk_chance:
+            t += rng.expovariate(1 / mean_afk)
+        else:
+            t += rng.expovariate(1 / mean_input_gap)
+        if rng.random() < mean_input_gap / mean_focus:
+            process = rng.choice(programs)
+    yield TraceEvent(end, None)
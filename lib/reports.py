@@ -0,0 +1,41 @@
+import math
+from typing import Iterator
+
+from config import Config
+from data import Profile, ProgramData, QUERY_GROUP_CATEGORY, QUERY_GROUP_PROGRAM
+from lib.data_management import bucket_into_other, sort_dict_by_value
+
+REPORT_CHUNK_BUCKETS = 1024
+
+def iter_activity(profile: Profile, start: float, end: float, step: float, group_by: str = QUERY_GROUP_CATEGORY, programs: list[ProgramData] | None = None, chunk_buckets: int = REPORT_CHUNK_BUCKETS) -> Iterator[tuple[float, str, float]]:
+    '''The (bucket start, key, seconds) rows behind the activity graph. The range is queried
+    `chunk_buckets` at a time, so long ranges are never held in memory as a whole.'''
+    if end <= start:
+        raise ValueError("End time must be after start time")
+    num_buckets = math.ceil((end - start) / step)
+    for first in range(0, num_buckets, chunk_buckets):
+        chunk_start = start + first * step
+        chunk_end = min(start + (first + chunk_buckets) * step, end)
+        keys, matrix = profile.query(chunk_start, chunk_end, step, group_by, programs)
+        for j in range(matrix.shape[1]):
+            bucket_start = chunk_start + j * step
+            for key, seconds in zip(keys, matrix[:, j].tolist()):
+                yield bucket_start, key, seconds
+
+def distribution(profile: Profile, config: Config, start: float, end: float, split_by_categories: bool = True, programs: list[ProgramData] | None = None) -> tuple[list[str], list[float]]:
+    '''Time per category or program over [start, end), small pieces lumped into "other", as shown by the pie chart.
+    Sorted in ascending order with "other" first.'''
+    if not programs:
+        programs = [p for p in profile.programs.values() if p.is_visible()]
+    if end <= start:
+        raise ValueError("End time must be after start time")
+    if split_by_categories:
+        keys, matrix = profile.query(start, end, None, QUERY_GROUP_CATEGORY, programs)
+        data = {category: float(row[0]) for category, row in zip(keys, matrix)}
+    else:
+        _, matrix = profile.query(start, end, None, QUERY_GROUP_PROGRAM, programs)
+        data = {prog.display_name: float(row[0]) for prog, row in zip(programs, matrix)}
+
+    total = sum(data.values())
+    data = bucket_into_other(data, config.min_piece_fraction_pie * total)
+    return sort_dict_by_value(data, reverse=False)
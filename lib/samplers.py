@@ -0,0 +1,41 @@
+from abc import abstractmethod
+import time
+from typing import Callable
+
+from lib.activity import ActivityMonitor, HookInputSource, InputSource, SystemInputSource
+from lib.processes import ProcessNameCache
+
+class Sampler:
+    '''Clock, foreground process and user input, as seen by the tracker. Input arrives through `input_source`,
+    which can be swapped for a FakeInputSource in tests.'''
+    def __init__(self, input_source: InputSource | None = None):
+        self.activity = ActivityMonitor(self.monotonic)
+        self.input_source = input_source if input_source is not None else InputSource()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+    @abstractmethod
+    def foreground_name(self) -> str | None: pass
+
+    def poll_input(self) -> ActivityMonitor:
+        '''Bring the activity monitor up to date with the input source'''
+        self.input_source.poll(self.activity)
+        return self.activity
+
+class Win32Sampler(Sampler):
+    '''Samples the live Windows desktop'''
+    def __init__(self, pointer: Callable[[], tuple[int, int]], input_source: InputSource | None = None):
+        super().__init__(input_source)
+        self.names = ProcessNameCache()
+        if input_source is None:
+            try:
+                self.input_source = SystemInputSource()
+            except (ImportError, AttributeError):
+                self.input_source = HookInputSource(self.activity, pointer)
+
+    def foreground_name(self) -> str | None:
+        return self.names.get_active_name(True)
@@ -0,0 +1,44 @@
+from config import Config
+
+class AdaptiveSampler:
+    '''Decides how long to wait before the next foreground sample'''
+    def __init__(self, config: Config):
+        self.config = config
+        self.current: str | None = None
+        self.interval: float = config.update_interval
+
+    def next_interval(self, program: str | None, afk: bool) -> float:
+        '''Sample rarely while AFK, quickly right after a focus change, and relax back to
+        `update_interval` while the same program stays in front'''
+        c = self.config
+        if not c.adaptive_sampling:
+            interval = c.update_interval
+        elif afk:
+            interval = c.idle_sample_interval
+        elif program != self.current:
+            interval = c.focus_sample_interval
+        else:
+            interval = min(c.update_interval, 2 * self.interval)
+        self.current = program
+        self.interval = interval
+        return interval
+
+    def is_idle(self) -> bool:
+        return self.interval > self.config.update_interval
+
+def active_segments(start: float, end: float, previous_input: float, last_input: float, timeout: float) -> list[tuple[float, float]]:
+    '''Stretches of [start, end] during which the user counted as present, given the last input seen
+    before `start` and the latest input seen by `end`'''
+    segments = []
+    present_until = min(end, previous_input + timeout)
+    if present_until > start:
+        segments.append((start, present_until))
+    if last_input > start:
+        resumed = max(last_input, segments[-1][1] if segments else start)
+        back_until = min(end, last_input + timeout)
+        if back_until > resumed:
+            if segments and segments[-1][1] >= resumed:
+                segments[-1] = (segments[-1][0], back_until)
+            else:
+                segments.append((resumed, back_until))
+    return segments
@@ -0,0 +1,89 @@
+from threading import Condition, Thread
+
+from data import Profile, SAVE_COMPACT, SAVE_JOURNAL
+from lib.journal import merge_entries
+
+class BackgroundSaver:
+    '''Writes profile saves on a worker thread so the UI and sampling never wait on disk'''
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.jobs: list[dict] = []
+        self.busy = False
+        self.closed = False
+        # A job whose write failed, written again along with the next save
+        self.failed: dict | None = None
+        self.condition = Condition()
+        self.thread = Thread(target = self.run, name = "ProfileSaver", daemon = True)
+        self.thread.start()
+
+    def request(self, compact: bool = False):
+        '''Queue a save; must be called from the thread that modifies the profile'''
+        job = self.profile.prepare_save(compact)
+        with self.condition:
+            retrying = self.requeue_failed()
+            if job is None:
+                if retrying:
+                    self.condition.notify_all()
+                return
+            if job["kind"] == SAVE_COMPACT:
+                # The snapshot already contains every change still waiting in the queue, but not their focus intervals
+                intervals = [r for queued in self.jobs for r in queued.get("intervals", [])]
+                if intervals:
+                    job["intervals"] = intervals + job.get("intervals", [])
+                self.jobs = [job]
+            elif self.jobs and self.jobs[-1]["kind"] == SAVE_JOURNAL:
+                queued = self.jobs[-1]
+                if queued["entry"] is None:
+                    queued["entry"] = job["entry"]
+                elif job["entry"]:
+                    merge_entries(queued["entry"], job["entry"])
+                if "intervals" in job:
+                    queued.setdefault("intervals", []).extend(job["intervals"])
+            else:
+                self.jobs.append(job)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.jobs and not self.closed:
+                    self.condition.wait()
+                if not self.jobs:
+                    return
+                job = self.jobs.pop(0)
+                self.busy = True
+            try:
+                self.profile.write_save(job)
+            except Exception as e:
+                print(f"Error saving profile: {e}")
+                # Make the next save rewrite the snapshot, since this one may be missing from disk
+                self.profile.journal_ready = False
+                # The job holds changes that are no longer pending on the profile, keep it until the next save
+                with self.condition:
+                    self.failed = job
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def requeue_failed(self) -> bool:
+        '''Put the last failed job back in front of the queue; must be called holding the condition'''
+        if self.failed is None:
+            return False
+        self.jobs.insert(0, self.failed)
+        self.failed = None
+        return True
+
+    def flush(self):
+        '''Block until every queued save has been written'''
+        with self.condition:
+            while self.jobs or self.busy:
+                self.condition.wait()
+
+    def close(self):
+        '''Write whatever is queued and stop the worker'''
+        with self.condition:
+            self.requeue_failed()
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
@@ -0,0 +1,66 @@
+import time
+import tkinter as tk
+from typing import Callable
+
+class Job:
+    def __init__(self, scheduler: "Scheduler", interval: Callable[[], float], callback: Callable[[], None], name: str):
+        self.scheduler = scheduler
+        self.interval = interval
+        self.callback = callback
+        self.name = name
+        self.due = self.scheduler.clock() + interval()
+        self.after_id: str | None = None
+
+    def arm(self):
+        delay = max(0, self.due - self.scheduler.clock())
+        self.after_id = self.scheduler.root.after(int(delay * 1000), self.fire)
+
+    def fire(self):
+        self.after_id = None
+        try:
+            self.callback()
+        except Exception as e:
+            print(f"Error in scheduled job {self.name}: {e}")
+        if self.scheduler.stopped: return
+        now = self.scheduler.clock()
+        self.due += self.interval()
+        if self.due < now:
+            # Fell behind (e.g. the machine was asleep); skip the missed runs instead of bursting through them
+            self.due = now + self.interval()
+        self.arm()
+
+    def reschedule(self, delay: float = 0):
+        '''Move the next run to `delay` seconds from now'''
+        self.cancel()
+        self.due = self.scheduler.clock() + delay
+        self.arm()
+
+    def cancel(self):
+        if self.after_id is not None:
+            self.scheduler.root.after_cancel(self.after_id)
+            self.after_id = None
+
+class Scheduler:
+    '''Runs periodic jobs from the Tk event loop, so nothing wakes up between their deadlines'''
+    def __init__(self, root: tk.Misc, clock: Callable[[], float] = time.monotonic):
+        self.root = root
+        self.clock = clock
+        self.jobs: list[Job] = []
+        self.stopped = False
+
+    def every(self, interval: float | Callable[[], float], callback: Callable[[], None], name: str = "", run_now: bool = False) -> Job:
+        '''Call `callback` every `interval` seconds; a callable interval is re-read after every run'''
+        job = Job(self, interval if callable(interval) else lambda: interval, callback, name or callback.__name__)
+        if run_now:
+            job.due = self.clock()
+        self.jobs.append(job)
+        job.arm()
+        return job
+
+    def run(self):
+        self.root.mainloop()
+
+    def stop(self):
+        self.stopped = True
+        for job in self.jobs:
+            job.cancel()
@@ -0,0 +1,475 @@
+import functools
+import json
+import lzma
+import mmap
+import os
+import sqlite3
+import struct
+import time
+from array import array
+from threading import Lock
+import numpy as np
+
+from lib.journal import append_journal, read_journal, reset_journal, write_atomic
+from lib.query import bucket_series, select_rollup
+from lib.timeseries import HourlySeries, hour_index, hour_to_month, month_hours
+
+CURRENT_SCHEMA_VERSION = 2
+DB_FILE = "db.json"
+DB_BACKUP_FILE = "db.json.bak"
+JOURNAL_FILE = "db.journal"
+SQLITE_FILE = "db.sqlite3"
+# Stays under SQLite's default limit on bound parameters in a single statement
+SQLITE_MAX_PARAMS = 500
+BINARY_FILE = "db.bin"
+BINARY_BACKUP_FILE = "db.bin.bak"
+BINARY_JOURNAL_FILE = "db.bin.journal"
+BINARY_MAGIC = b"OTDB"
+BINARY_VERSION = 1
+# magic, format version, header length
+BINARY_PREAMBLE = struct.Struct("<4sIQ")
+HISTORY_DIR = "history"
+HOT_FILE = "hot.json"
+HOT_BACKUP_FILE = "hot.json.bak"
+HOT_JOURNAL_FILE = "hot.journal"
+SEGMENT_SUFFIX = ".json.xz"
+SEGMENT_CACHE_SIZE = 6
+SAVE_COMPACT = "compact"
+SAVE_JOURNAL = "journal"
+STORAGE_JSON = "json"
+STORAGE_SQLITE = "sqlite"
+STORAGE_BINARY = "binary"
+STORAGE_PARTITIONED = "partitioned"
+
+class JsonStorage:
+    '''A full JSON snapshot plus an append-only journal of the changes saved since'''
+    # Series are always fully loaded, and saves periodically rewrite the snapshot
+    lazy_series = False
+    snapshots = True
+    migrate_from_json = False
+    # Whether part of every program's history lives only in storage (see query_buckets)
+    cold_history = False
+
+    def __init__(self, path: str = DB_FILE, backup_path: str = DB_BACKUP_FILE, journal_path: str = JOURNAL_FILE):
+        self.path = path
+        self.backup_path = backup_path
+        self.journal_path = journal_path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path) or os.path.exists(self.backup_path)
+
+    def load(self) -> tuple[dict | None, list[dict] | None]:
+        '''Return the snapshot and the journal entries to replay on top of it (None if the journal can't be used)'''
+        for path in (self.path, self.backup_path):
+            try:
+                data = self.read_snapshot(path)
+            except Exception as e:
+                print(f"Error loading profile from {path}: {e}")
+                continue
+            journal_id, entries = read_journal(self.journal_path)
+            if journal_id != data.get("journal_id", 0):
+                # Missing, or left over from before the snapshot was written; the next save compacts
+                return data, None
+            return data, entries
+        return None, None
+
+    def write(self, job: dict):
+        if job["kind"] == SAVE_JOURNAL:
+            append_journal(self.journal_path, job["entry"])
+            return
+        self.write_snapshot(job["snapshot"])
+        # Only start the new journal once the snapshot that includes the old one is written
+        reset_journal(self.journal_path, job["journal_id"])
+
+    def read_snapshot(self, path: str) -> dict:
+        with open(path) as f:
+            return json.load(f)
+    def write_snapshot(self, snapshot: dict):
+        write_atomic(self.path, snapshot, self.backup_path)
+
+    def detach_history(self, programs):
+        '''Called on the profile's thread before a snapshot is taken'''
+        pass
+
+class BinaryStorage(JsonStorage):
+    '''A JSON metadata header followed by a memory-mapped region of float32 hourly records per program.
+    Only the header is parsed on load; series are paged in from the map when a program is touched.'''
+    lazy_series = True
+    migrate_from_json = True
+
+    def __init__(self, path: str = BINARY_FILE, backup_path: str = BINARY_BACKUP_FILE, journal_path: str = BINARY_JOURNAL_FILE):
+        super().__init__(path, backup_path, journal_path)
+        self.file = None
+        self.map: mmap.mmap | None = None
+        # program id -> (base hour, record count, byte offset into the map)
+        self.index: dict[str, tuple[int, int, int]] = {}
+        # Guards the map, which the background saver swaps out when it writes a new snapshot
+        self.lock = Lock()
+
+    def read_snapshot(self, path: str) -> dict:
+        with self.lock:
+            self.close()
+            self.file = open(path, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+            header = self.read_header()
+        return header
+
+    def read_header(self) -> dict:
+        magic, version, header_length = BINARY_PREAMBLE.unpack_from(self.map, 0)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError(f"Not a version {BINARY_VERSION} OnTrack binary profile")
+        data_start = BINARY_PREAMBLE.size + header_length
+        header = json.loads(self.map[BINARY_PREAMBLE.size:data_start])
+        self.index = {}
+        for k, program in header["programs"].items():
+            base, count, offset = program.pop("series")
+            self.index[k] = (base, count, data_start + offset)
+        return header
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+        self.map = None
+        self.file = None
+
+    def import_snapshot(self, snapshot: dict):
+        self.write({"kind": SAVE_COMPACT, "journal_id": snapshot["journal_id"], "snapshot": snapshot})
+
+    def write_snapshot(self, snapshot: dict):
+        # Records are laid out back to back after the header, with offsets relative to the end of the header
+        programs = {}
+        regions = []
+        offset = 0
+        with self.lock:
+            for k, program in snapshot["programs"].items():
+                series = program["time_series"]
+                if series is not None:
+                    base = series.base
+                    data = np.frombuffer(series.values, dtype = np.float64).astype(np.float32).tobytes()
+                else:
+                    # Not loaded, so the mapped records are still current
+                    base, count, old_offset = self.index.get(k, (0, 0, 0))
+                    data = self.map[old_offset:old_offset + 4 * count] if self.map is not None else b""
+                meta = {m: v for m, v in program.items() if m != "time_series"}
+                programs[k] = {**meta, "series": [base, len(data) // 4, offset]}
+                regions.append(data)
+                offset += len(data)
+        header = {**{k: v for k, v in snapshot.items() if k != "programs"}, "programs": programs}
+        header_bytes = json.dumps(header, separators = (",", ":")).encode()
+        # Keep the records 4-byte aligned
+        header_bytes += b" " * (-(BINARY_PREAMBLE.size + len(header_bytes)) % 4)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(BINARY_PREAMBLE.pack(BINARY_MAGIC, BINARY_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for data in regions:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        with self.lock:
+            # A mapped file can't be replaced on Windows, so unmap around the swap
+            self.close()
+            if os.path.exists(self.path):
+                os.replace(self.path, self.backup_path)
+            os.replace(tmp_path, self.path)
+            self.file = open(self.path, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+            self.read_header()
+
+    def records(self, program_id: str) -> tuple[int, np.ndarray]:
+        '''Base hour and a view of a program's mapped records.
+        Must be called with the lock held, and the view dropped before releasing it.'''
+        base, count, offset = self.index.get(program_id, (0, 0, 0))
+        if count == 0 or self.map is None:
+            return base, np.zeros(0, dtype = np.float32)
+        return base, np.frombuffer(self.map, dtype = np.float32, count = count, offset = offset)
+
+    def load_series(self, program_id: str) -> HourlySeries:
+        with self.lock:
+            base, records = self.records(program_id)
+            values = array("d", records.astype(np.float64).tobytes())
+            del records
+        return HourlySeries(base, values)
+
+    def series_bounds(self, program_id: str) -> tuple[int, int] | None:
+        base, count, _ = self.index.get(program_id, (0, 0, 0))
+        return None if count == 0 else (base, base + count - 1)
+
+    def query_buckets(self, program_ids: list[str], bounds: np.ndarray) -> np.ndarray:
+        '''Bucket totals per program, reading only the mapped pages inside the requested range'''
+        result = np.zeros((len(program_ids), len(bounds) - 1))
+        with self.lock:
+            for i, k in enumerate(program_ids):
+                self.bucket_records(k, bounds, result[i])
+        return result
+    def bucket_records(self, program_id: str, bounds: np.ndarray, out: np.ndarray):
+        base, records = self.records(program_id)
+        lo = max(int(bounds[0]) - base, 0)
+        hi = min(int(bounds[-1]) - base, len(records))
+        if hi <= lo: return
+        prefix = np.zeros(hi - lo + 1)
+        np.cumsum(records[lo:hi], dtype = np.float64, out = prefix[1:])
+        out[:] = np.diff(prefix[np.clip(bounds - base - lo, 0, hi - lo)])
+
+@functools.lru_cache(maxsize = SEGMENT_CACHE_SIZE)
+def read_segment(path: str) -> dict[str, HourlySeries]:
+    '''Decompress a month segment. Segment files are never modified once written, so they can be cached by path.'''
+    with lzma.open(path, "rt") as f:
+        return {k: HourlySeries.from_dict(v) for k, v in json.load(f).items()}
+
+class PartitionedStorage(JsonStorage):
+    '''A small "hot" snapshot and journal holding the current month, plus one lzma-compressed segment
+    per older month. Loading reads only the hot snapshot; range queries open only the months they cover.'''
+    cold_history = True
+    migrate_from_json = True
+
+    def __init__(self, directory: str = HISTORY_DIR):
+        super().__init__(os.path.join(directory, HOT_FILE), os.path.join(directory, HOT_BACKUP_FILE), os.path.join(directory, HOT_JOURNAL_FILE))
+        self.directory = directory
+        # month -> segment file name, as listed by the current hot snapshot
+        self.segments: dict[str, str] = {}
+        self.previous_segments: dict[str, str] = {}
+        # program id -> (first, last) hour stored in segments
+        self.cold_bounds: dict[str, tuple[int, int]] = {}
+        # Hours moved out of memory by detach_history that aren't in a segment yet
+        self.unwritten: list[dict[str, HourlySeries]] = []
+        self.lock = Lock()
+
+    def read_snapshot(self, path: str) -> dict:
+        data = super().read_snapshot(path)
+        with self.lock:
+            self.segments = data.pop("segments", {})
+            self.previous_segments = self.segments
+            self.cold_bounds = {}
+            for k, program in data.get("programs", {}).items():
+                bounds = program.pop("cold_bounds", None)
+                if bounds: self.cold_bounds[k] = tuple(bounds)
+        return data
+
+    def detach_history(self, programs):
+        '''Move every hour before the current month out of the in-memory series'''
+        month_start, _ = month_hours(hour_to_month(hour_index(time.time())))
+        detached = {}
+        for p in programs:
+            if p.time_series.is_empty() or p.time_series.first_hour() >= month_start: continue
+            detached[p.id] = p.time_series.split_before(month_start)
+        if detached:
+            with self.lock:
+                self.unwritten.append(detached)
+
+    def import_snapshot(self, snapshot: dict):
+        month_start, _ = month_hours(hour_to_month(hour_index(time.time())))
+        detached = {}
+        for k, program in snapshot["programs"].items():
+            detached[k] = program["time_series"].split_before(month_start)
+        with self.lock:
+            self.unwritten.append(detached)
+        self.write({"kind": SAVE_COMPACT, "journal_id": snapshot["journal_id"], "snapshot": snapshot})
+
+    def write_snapshot(self, snapshot: dict):
+        os.makedirs(self.directory, exist_ok = True)
+        with self.lock:
+            parts = list(self.unwritten)
+            segments = dict(self.segments)
+            cold_bounds = dict(self.cold_bounds)
+        # Group the detached hours by month, then fold them into that month's segment
+        months: dict[str, dict[str, list[tuple[int, float]]]] = {}
+        for part in parts:
+            for k, series in part.items():
+                for h, v in series.items():
+                    months.setdefault(hour_to_month(h), {}).setdefault(k, []).append((h, v))
+                    first, last = cold_bounds.get(k, (h, h))
+                    cold_bounds[k] = (min(first, h), max(last, h))
+        generation = snapshot["journal_id"]
+        for month, programs in months.items():
+            merged = {}
+            if month in segments:
+                merged = {k: v.copy() for k, v in read_segment(self.segment_path(segments[month])).items()}
+            for k, items in programs.items():
+                series = merged.setdefault(k, HourlySeries())
+                for h, v in sorted(items):
+                    series.add(h, v)
+            # Each write gets a new name, so a snapshot only ever points at complete segments
+            name = f"{month}.{generation}{SEGMENT_SUFFIX}"
+            with lzma.open(self.segment_path(name), "wt") as f:
+                json.dump({k: v.to_dict(with_rollups = True) for k, v in merged.items()}, f, separators = (",", ":"))
+            segments[month] = name
+
+        for k, program in snapshot["programs"].items():
+            if k in cold_bounds:
+                program["cold_bounds"] = list(cold_bounds[k])
+        write_atomic(self.path, {**snapshot, "segments": segments}, self.backup_path)
+
+        with self.lock:
+            self.unwritten = [p for p in self.unwritten if not any(p is q for q in parts)]
+            self.previous_segments, self.segments = self.segments, segments
+            self.cold_bounds = cold_bounds
+            referenced = set(self.segments.values()) | set(self.previous_segments.values())
+        # The backup snapshot may still point at the previous generation, anything older can go
+        for name in os.listdir(self.directory):
+            if name.endswith(SEGMENT_SUFFIX) and name not in referenced:
+                os.remove(self.segment_path(name))
+
+    def segment_path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def series_bounds(self, program_id: str) -> tuple[int, int] | None:
+        with self.lock:
+            bounds = [self.cold_bounds[program_id]] if program_id in self.cold_bounds else []
+            for part in self.unwritten:
+                series = part.get(program_id)
+                if series is not None and not series.is_empty():
+                    bounds.append((series.first_hour(), series.last_hour()))
+        if not bounds:
+            return None
+        return min(b[0] for b in bounds), max(b[1] for b in bounds)
+
+    def query_buckets(self, program_ids: list[str], bounds: np.ndarray) -> np.ndarray:
+        '''Bucket totals of the history that is not held in memory'''
+        result = np.zeros((len(program_ids), len(bounds) - 1))
+        first, last = int(bounds[0]), int(bounds[-1])
+        with self.lock:
+            sources = list(self.unwritten)
+            paths = []
+            for month, name in self.segments.items():
+                month_start, month_end = month_hours(month)
+                if month_start < last and month_end > first:
+                    paths.append(self.segment_path(name))
+        sources.extend(read_segment(path) for path in paths)
+        rollup = select_rollup(bounds)
+        for source in sources:
+            for i, k in enumerate(program_ids):
+                series = source.get(k)
+                if series is not None and not series.is_empty():
+                    result[i] += bucket_series(series, bounds, rollup)
+        return result
+
+class SqliteStorage:
+    '''Programs and hourly buckets in a SQLite file; series are only read when a program is touched'''
+    lazy_series = True
+    snapshots = False
+    migrate_from_json = True
+    cold_history = False
+
+    def __init__(self, path: str = SQLITE_FILE):
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        # The connection is shared between the UI thread (reads) and the background saver (writes)
+        self.lock = Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread = False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS programs (id TEXT PRIMARY KEY, time REAL NOT NULL DEFAULT 0, metadata TEXT NOT NULL DEFAULT '{}');
+                CREATE TABLE IF NOT EXISTS buckets (
+                    program_id TEXT NOT NULL,
+                    hour INTEGER NOT NULL,
+                    seconds REAL NOT NULL,
+                    PRIMARY KEY (program_id, hour)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS buckets_by_hour ON buckets (hour, program_id, seconds);
+            """)
+        return self.connection
+
+    def load(self) -> tuple[dict | None, list[dict] | None]:
+        if not self.exists():
+            return None, None
+        with self.lock:
+            db = self.connect()
+            programs = {k: {"time": t, **json.loads(meta)} for k, t, meta in db.execute("SELECT id, time, metadata FROM programs")}
+            settings = dict(db.execute("SELECT key, value FROM settings"))
+        return {
+            "version": CURRENT_SCHEMA_VERSION,
+            "programs": programs,
+            "selected_program": settings.get("selected_program", ""),
+        }, None
+
+    def import_snapshot(self, snapshot: dict):
+        '''One-shot migration of a full profile snapshot (as produced by Profile.snapshot)'''
+        with self.lock:
+            db = self.connect()
+            with db:
+                for k, program in snapshot["programs"].items():
+                    meta = {m: v for m, v in program.items() if m not in ("time", "time_series")}
+                    db.execute("INSERT OR REPLACE INTO programs (id, time, metadata) VALUES (?, ?, ?)", (k, program["time"], json.dumps(meta)))
+                    db.executemany("INSERT OR REPLACE INTO buckets (program_id, hour, seconds) VALUES (?, ?, ?)", ((k, h, v) for h, v in program["time_series"].items()))
+                db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('selected_program', ?)", (snapshot["selected_program"],))
+
+    def write(self, job: dict):
+        entry = job["entry"]
+        program_deltas: dict[str, float] = {}
+        for k, _, delta in entry.get("time", []):
+            program_deltas[k] = program_deltas.get(k, 0) + delta
+        with self.lock:
+            db = self.connect()
+            with db:
+                db.executemany("""
+                    INSERT INTO programs (id, metadata) VALUES (?, ?)
+                    ON CONFLICT (id) DO UPDATE SET metadata = excluded.metadata
+                """, ((k, json.dumps(meta)) for k, meta in entry.get("meta", {}).items()))
+                db.executemany("""
+                    INSERT INTO programs (id, time) VALUES (?, ?)
+                    ON CONFLICT (id) DO UPDATE SET time = time + excluded.time
+                """, program_deltas.items())
+                db.executemany("""
+                    INSERT INTO buckets (program_id, hour, seconds) VALUES (?, ?, ?)
+                    ON CONFLICT (program_id, hour) DO UPDATE SET seconds = seconds + excluded.seconds
+                """, entry.get("time", []))
+                if "selected_program" in entry:
+                    db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('selected_program', ?)", (entry["selected_program"],))
+
+    def load_series(self, program_id: str) -> HourlySeries:
+        with self.lock:
+            rows = self.connect().execute("SELECT hour, seconds FROM buckets WHERE program_id = ? ORDER BY hour", (program_id,)).fetchall()
+        return HourlySeries.from_items(rows)
+
+    def series_bounds(self, program_id: str) -> tuple[int, int] | None:
+        with self.lock:
+            first, last = self.connect().execute("SELECT MIN(hour), MAX(hour) FROM buckets WHERE program_id = ?", (program_id,)).fetchone()
+        return None if first is None else (first, last)
+
+    def query_buckets(self, program_ids: list[str], bounds: np.ndarray) -> np.ndarray:
+        '''Bucket totals per program for the hour bounds produced by bucket_hour_bounds, aggregated in SQL'''
+        result = np.zeros((len(program_ids), len(bounds) - 1))
+        rows_by_id = {k: i for i, k in enumerate(program_ids)}
+        first = int(bounds[0])
+        # Group whole buckets in SQL when they are evenly sized (the usual hourly/daily/weekly case),
+        # otherwise group by hour and map hours to buckets afterwards
+        step = int(bounds[1] - bounds[0]) if len(bounds) > 1 else 1
+        even = step > 0 and np.array_equal(bounds, np.minimum(first + step * np.arange(len(bounds)), bounds[-1]))
+        if not even:
+            step = 1
+        rows = []
+        with self.lock:
+            # Filtering on the ids lets SQLite read only their ranges of the (program_id, hour) key
+            for chunk in range(0, len(program_ids), SQLITE_MAX_PARAMS):
+                ids = program_ids[chunk:chunk + SQLITE_MAX_PARAMS]
+                rows.extend(self.connect().execute(f"""
+                    SELECT program_id, (hour - ?) / ? AS slot, SUM(seconds) FROM buckets
+                    WHERE program_id IN ({", ".join("?" * len(ids))}) AND hour >= ? AND hour < ?
+                    GROUP BY program_id, slot
+                """, (first, step, *ids, first, int(bounds[-1]))).fetchall())
+        for k, slot, seconds in rows:
+            i = rows_by_id[k]
+            bucket = slot if even else np.searchsorted(bounds, first + slot, side = "right") - 1
+            result[i, bucket] += seconds
+        return result
+
+STORAGE_BACKENDS = {
+    STORAGE_JSON: JsonStorage,
+    STORAGE_SQLITE: SqliteStorage,
+    STORAGE_BINARY: BinaryStorage,
+    STORAGE_PARTITIONED: PartitionedStorage,
+}
+def create_storage(name: str) -> JsonStorage | SqliteStorage | BinaryStorage | PartitionedStorage:
+    if name not in STORAGE_BACKENDS:
+        print(f"[WARNING] unknown storage backend {name}, using {STORAGE_JSON}")
+        name = STORAGE_JSON
+    return STORAGE_BACKENDS[name]()
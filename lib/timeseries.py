@@ -0,0 +1,236 @@
+from array import array
+from datetime import datetime
+import calendar
+import math
+import time
+
+import numpy as np
+
+HOUR = 60 * 60
+HOUR_KEY_FORMAT = "%Y-%m-%dT%H:00:00"
+
+# Hour indices count local (wall clock) hours since 1970-01-01T00:00, so that
+# bucket boundaries match the "%Y-%m-%dT%H:00:00" keys of older profiles.
+def local_seconds(timestamp: float) -> float:
+    return timestamp + time.localtime(timestamp).tm_gmtoff
+def hour_index(timestamp: float) -> int:
+    return int(local_seconds(timestamp) // HOUR)
+def hour_ceil(timestamp: float) -> int:
+    return math.ceil(local_seconds(timestamp) / HOUR)
+def hour_to_timestamp(hour: int) -> float:
+    return time.mktime(time.gmtime(hour * HOUR)[:8] + (-1,))
+def hour_to_key(hour: int) -> str:
+    return time.strftime(HOUR_KEY_FORMAT, time.gmtime(hour * HOUR))
+def hour_to_month(hour: int) -> str:
+    return time.strftime("%Y-%m", time.gmtime(hour * HOUR))
+def month_hours(month: str) -> tuple[int, int]:
+    '''First hour of a "%Y-%m" month and the first hour of the month after it'''
+    year, mon = (int(x) for x in month.split("-"))
+    next_month = f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+    return key_to_hour(f"{month}-01T00:00:00"), key_to_hour(f"{next_month}-01T00:00:00")
+def key_to_hour(key: str) -> int:
+    return calendar.timegm(datetime.fromisoformat(key).timetuple()) // HOUR
+
+def bucket_hour_bounds(start: float, end: float, bucket_size: float) -> list[int]:
+    '''Hour indices delimiting each bucket; bucket i covers hours [bounds[i], bounds[i+1])'''
+    num_buckets = math.ceil((end - start) / bucket_size)
+    offset = local_seconds(start)
+    last = hour_ceil(end)
+    bounds = [math.ceil(offset / HOUR)]
+    for i in range(num_buckets):
+        bounds.append(max(bounds[-1], min(math.ceil((offset + (i + 1) * bucket_size) / HOUR), last)))
+    return bounds
+
+# Rollup tiers, coarsest first: tier -> (unit containing a local hour, first local hour of a unit)
+def day_of_hour(hour: int) -> int:
+    return hour // 24
+def day_start(day: int) -> int:
+    return day * 24
+# 1970-01-01 was a Thursday; weeks start on Monday
+def week_of_hour(hour: int) -> int:
+    return (hour // 24 + 3) // 7
+def week_start(week: int) -> int:
+    return (week * 7 - 3) * 24
+def month_of_hour(hour: int) -> int:
+    t = time.gmtime(hour * HOUR)
+    return (t.tm_year - 1970) * 12 + t.tm_mon - 1
+def month_start(month: int) -> int:
+    return calendar.timegm((1970 + month // 12, month % 12 + 1, 1, 0, 0, 0)) // HOUR
+ROLLUP_TIERS = {
+    "month": (month_of_hour, month_start),
+    "week": (week_of_hour, week_start),
+    "day": (day_of_hour, day_start),
+}
+
+class HourlySeries:
+    '''Contiguous per-hour totals starting at local hour index `base`'''
+    def __init__(self, base: int = 0, values: array | None = None, rollups: "dict[str, HourlySeries] | None" = None):
+        self.base = base
+        self.values = values if values is not None else array("d")
+        # Lazily built cumulative sums with a leading zero, see prefix_sums
+        self._prefix: array | None = None
+        # Lazily built totals per day/week/month, see rollup
+        self._rollups: dict[str, HourlySeries] = rollups if rollups is not None else {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def is_empty(self) -> bool:
+        return len(self.values) == 0
+    def first_hour(self) -> int:
+        return self.base
+    def last_hour(self) -> int:
+        return self.base + len(self.values) - 1
+
+    def add(self, hour: int, delta: float):
+        for tier, rollup in self._rollups.items():
+            rollup.add(ROLLUP_TIERS[tier][0](hour), delta)
+        if self.is_empty():
+            self.base = hour
+            self.values.append(delta)
+            self._prefix = None
+            return
+        if hour < self.base:
+            self.values[0:0] = array("d", bytes(8 * (self.base - hour)))
+            self.base = hour
+            self._prefix = None
+        idx = hour - self.base
+        if idx >= len(self.values):
+            if self._prefix is not None:
+                self._prefix.extend([self._prefix[-1]] * (idx - len(self.values) + 1))
+            self.values.frombytes(bytes(8 * (idx - len(self.values) + 1)))
+        self.values[idx] += delta
+        if self._prefix is None:
+            return
+        if idx == len(self.values) - 1:
+            # Time is almost always added to the latest hour, which only moves the last prefix
+            self._prefix[-1] += delta
+        else:
+            self._prefix = None
+
+    def prefix_sums(self) -> array:
+        '''Range index over the series: the total of local hours [a, b) is prefix[b - base] - prefix[a - base]'''
+        if self._prefix is None:
+            self._prefix = array("d", bytes(8))
+            if self.values:
+                self._prefix.frombytes(np.cumsum(np.frombuffer(self.values, dtype=np.float64)).tobytes())
+        return self._prefix
+
+    def split_before(self, hour: int) -> "HourlySeries":
+        '''Remove the hours before `hour` from this series and return them as a new one'''
+        n = min(max(hour - self.base, 0), len(self.values))
+        older = HourlySeries(self.base, self.values[:n])
+        del self.values[:n]
+        self.base += n
+        # Don't let the series start on empty hours, so first_hour stays meaningful
+        k = next((i for i, v in enumerate(self.values) if v != 0), len(self.values))
+        del self.values[:k]
+        self.base += k
+        self._prefix = None
+        self._rollups = {}
+        return older
+
+    def get(self, hour: int) -> float:
+        idx = hour - self.base
+        if idx < 0 or idx >= len(self.values):
+            return 0
+        return self.values[idx]
+
+    def _clip(self, hour_start: int, hour_end: int) -> tuple[int, int]:
+        lo = max(hour_start - self.base, 0)
+        hi = min(hour_end - self.base, len(self.values))
+        return lo, max(lo, hi)
+
+    def rollup(self, tier: str) -> "HourlySeries":
+        '''Totals per unit of a ROLLUP_TIERS tier, as a series indexed by unit instead of hour'''
+        if tier not in self._rollups:
+            to_unit, unit_start = ROLLUP_TIERS[tier]
+            rollup = HourlySeries()
+            if not self.is_empty():
+                first, last = to_unit(self.first_hour()), to_unit(self.last_hour())
+                starts = np.array([unit_start(u) for u in range(first, last + 2)]) - self.base
+                prefix = np.frombuffer(self.prefix_sums(), dtype=np.float64)
+                rollup.base = first
+                rollup.values = array("d", np.diff(prefix[np.clip(starts, 0, len(self.values))]).tobytes())
+            self._rollups[tier] = rollup
+        return self._rollups[tier]
+
+    def range_sum(self, hour_start: int, hour_end: int) -> float:
+        '''Total over the hours in [hour_start, hour_end)'''
+        lo, hi = self._clip(hour_start, hour_end)
+        if lo == hi:
+            return 0.0
+        prefix = self.prefix_sums()
+        return prefix[hi] - prefix[lo]
+
+    def timeframe_sum(self, start: float, end: float) -> float:
+        return self.range_sum(hour_ceil(start), hour_ceil(end))
+
+    def bucketed(self, start: float, end: float, bucket_size: float) -> list[float]:
+        '''Sums of the hours whose start falls in each [start + i * bucket_size, start + (i+1) * bucket_size) window'''
+        bounds = bucket_hour_bounds(start, end, bucket_size)
+        if self.is_empty():
+            return [0.0] * (len(bounds) - 1)
+        return [self.range_sum(lo, hi) for lo, hi in zip(bounds, bounds[1:])]
+
+    def items(self):
+        '''Yield (hour, value) for every non-zero hour'''
+        for i, v in enumerate(self.values):
+            if v != 0:
+                yield self.base + i, v
+
+    def copy(self) -> "HourlySeries":
+        '''Independent copy that keeps the prefix sums and rollups already built, so queries on it stay cheap'''
+        rollups = {k: r.copy() for k, r in self._rollups.items()}
+        copy = HourlySeries(self.base, array("d", self.values), rollups)
+        if self._prefix is not None:
+            copy._prefix = array("d", self._prefix)
+        return copy
+
+    def slice(self, hour_start: int, hour_end: int, with_rollups: bool = True) -> "HourlySeries":
+        '''Copy of the hours in [hour_start, hour_end), only meant for queries inside that range. The prefix sums and
+        rollups are built on this series, where add() keeps them current, and the slice gets the matching part of them.'''
+        lo, hi = self._clip(hour_start, hour_end)
+        if lo == hi:
+            return HourlySeries()
+        part = HourlySeries(self.base + lo, self.values[lo:hi])
+        # Still offset by the hours before the slice, which range sums cancel out
+        part._prefix = self.prefix_sums()[lo:hi + 1]
+        if with_rollups:
+            for tier, (to_unit, _) in ROLLUP_TIERS.items():
+                part._rollups[tier] = self.rollup(tier).slice(to_unit(part.first_hour()), to_unit(part.last_hour()) + 1, False)
+        return part
+
+    def to_dict(self, with_rollups: bool = False) -> dict:
+        '''The rollups built so far are stored along with the values, so they are back in memory after loading.
+        `with_rollups` builds and stores every tier, e.g. for cold segments that are read again and again but never change.'''
+        if self.is_empty():
+            return {}
+        result = {
+            "start": hour_to_key(self.base),
+            "values": self.values.tolist(),
+        }
+        tiers = ROLLUP_TIERS if with_rollups else [k for k in ROLLUP_TIERS if k in self._rollups]
+        if tiers:
+            result["rollups"] = {k: {"base": r.base, "values": r.values.tolist()} for k, r in ((k, self.rollup(k)) for k in tiers)}
+        return result
+
+    @staticmethod
+    def from_dict(data: dict) -> "HourlySeries":
+        if not data:
+            return HourlySeries()
+        rollups = {k: HourlySeries(r["base"], array("d", r["values"])) for k, r in data.get("rollups", {}).items() if k in ROLLUP_TIERS}
+        return HourlySeries(key_to_hour(data["start"]), array("d", data["values"]), rollups)
+
+    @staticmethod
+    def from_items(items) -> "HourlySeries":
+        '''Build a series from (hour, seconds) pairs'''
+        series = HourlySeries()
+        for h, v in sorted(items):
+            series.add(h, v)
+        return series
+
+    @staticmethod
+    def from_keyed_dict(data: dict[str, float]) -> "HourlySeries":
+        '''Build a series from the legacy {"%Y-%m-%dT%H:00:00": seconds} mapping'''
+        return HourlySeries.from_items((key_to_hour(k), v) for k, v in data.items())
@@ -0,0 +1,72 @@
+from config import Config
+from data import Profile
+from lib.sampling import AdaptiveSampler, active_segments
+from lib.samplers import Sampler
+from lib.scheduler import Job, Scheduler
+
+class Tracker:
+    '''Credits foreground time to programs from whatever a sampler backend reports'''
+    def __init__(self, config: Config, profile: Profile, sampler: Sampler):
+        self.config = config
+        self.profile = profile
+        self.sampler = sampler
+        self.adaptive = AdaptiveSampler(config)
+        now = sampler.monotonic()
+        self.last_checked = now
+        self.last_input = sampler.activity.last_input
+        self.previous_input = self.last_input
+        self.active_window: str | None = None
+        self.samples = 0
+
+    def refresh_input(self):
+        activity = self.sampler.poll_input()
+        self.last_input = activity.last_input
+        self.profile.afk_time = activity.idle_time(self.sampler.monotonic())
+
+    def is_afk(self) -> bool:
+        return self.sampler.activity.is_afk(self.config.afk_timeout, self.sampler.monotonic())
+
+    def watch_input(self) -> bool:
+        '''Refresh the AFK timer, returns True if sampling should resume right away'''
+        self.refresh_input()
+        # Back from AFK, don't wait out the idle interval
+        return self.adaptive.is_idle() and not self.is_afk()
+
+    def sample(self):
+        now = self.sampler.monotonic()
+        # Never increase program time by more than twice the interval this sample was scheduled for
+        start = max(self.last_checked, now - 2 * self.adaptive.interval)
+        self.last_checked = now
+        self.refresh_input()
+        input_before = self.previous_input
+        self.previous_input = self.last_input
+        self.samples += 1
+
+        app_name = self.sampler.foreground_name()
+        self.adaptive.next_interval(app_name, self.is_afk())
+        if (app_name == None): return
+        self.active_window = app_name
+
+        program = self.profile.get_program(app_name)
+
+        if (program != None):
+            # Record where in the interval the user was present; AFK stretches are flagged and only
+            # credited to programs without an AFK timer when the focus log is flushed
+            offset = self.sampler.time() - now
+            log = self.profile.focus_log
+            cursor = start
+            for a, b in active_segments(start, now, input_before, self.last_input, self.config.afk_timeout):
+                log.add(app_name, offset + cursor, offset + a, True)
+                log.add(app_name, offset + a, offset + b, False)
+                cursor = b
+            log.add(app_name, offset + cursor, offset + now, True)
+
+def schedule_tracking(scheduler: Scheduler, tracker: Tracker) -> Job:
+    '''Register the sampling, input watch and focus log flush jobs, returns the sampling job'''
+    def watch_input():
+        if tracker.watch_input():
+            sample_job.reschedule()
+    sample_job = scheduler.every(lambda: tracker.adaptive.interval, tracker.sample, "sample", run_now = True)
+    scheduler.every(lambda: tracker.config.update_interval, watch_input, run_now = True)
+    scheduler.every(lambda: tracker.config.focus_flush_interval, tracker.profile.flush_focus_log, "flush")
+    return sample_job
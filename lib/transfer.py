@@ -0,0 +1,121 @@
+import csv
+from itertools import islice
+import json
+import os
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from data import Profile, ProgramData
+from lib.timeseries import hour_to_key, key_to_hour
+
+# Exports and imports move (program id, category, local hour index, seconds) rows
+HourRow = tuple[str, str, int, float]
+ROW_FIELDS = ["program", "category", "hour", "seconds"]
+TRANSFER_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".npy": "npy"}
+EXPORT_CHUNK_HOURS = 24 * 31
+IMPORT_CHUNK_ROWS = 50000
+
+def transfer_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in TRANSFER_FORMATS:
+        raise ValueError(f"Unknown export format {ext or path}, expected one of {', '.join(TRANSFER_FORMATS)}")
+    return TRANSFER_FORMATS[ext]
+
+def labels_path(npy_path: str) -> str:
+    '''The file naming the rows and first column of a .npy export'''
+    return os.path.splitext(npy_path)[0] + ".json"
+
+def hour_bounds(programs: list[ProgramData]) -> tuple[list[ProgramData], int, int]:
+    '''The programs that have any time, and the first and last hour over all of them'''
+    bounds = [(p, p.get_hour_bounds()) for p in programs]
+    bounds = [(p, b) for p, b in bounds if b is not None]
+    first = min((b[0] for _, b in bounds), default = 0)
+    last = max((b[1] for _, b in bounds), default = -1)
+    return [p for p, _ in bounds], first, last
+
+def iter_hours(profile: Profile, programs: list[ProgramData] | None = None, chunk_hours: int = EXPORT_CHUNK_HOURS) -> Iterator[HourRow]:
+    '''Every non-zero hour of `programs` (all of them by default). The range is read `chunk_hours` at a time
+    for all programs together, so every part of the stored history is only read once.'''
+    programs, first, last = hour_bounds(programs or list(profile.programs.values()))
+    for start in range(first, last + 1, chunk_hours):
+        values = profile.hourly_values(programs, start, min(start + chunk_hours, last + 1))
+        for row, i in zip(*np.nonzero(values)):
+            program = programs[row]
+            yield program.id, program.category, start + int(i), float(values[row, i])
+
+def write_csv(path: str, rows: Iterable[HourRow]):
+    with open(path, "w", newline = "") as f:
+        writer = csv.writer(f)
+        writer.writerow(ROW_FIELDS)
+        writer.writerows((program, category, hour_to_key(hour), seconds) for program, category, hour, seconds in rows)
+
+def read_csv(path: str) -> Iterator[HourRow]:
+    with open(path, newline = "") as f:
+        for row in csv.DictReader(f):
+            yield row["program"], row["category"], key_to_hour(row["hour"]), float(row["seconds"])
+
+def write_ndjson(path: str, rows: Iterable[HourRow]):
+    '''One {"program", "category", "hour", "seconds"} object per line'''
+    with open(path, "w") as f:
+        for program, category, hour, seconds in rows:
+            f.write(json.dumps({"program": program, "category": category, "hour": hour_to_key(hour), "seconds": seconds}) + "\n")
+
+def read_ndjson(path: str) -> Iterator[HourRow]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                yield row["program"], row["category"], key_to_hour(row["hour"]), float(row["seconds"])
+
+def write_npy(path: str, profile: Profile, programs: list[ProgramData] | None = None, chunk_hours: int = EXPORT_CHUNK_HOURS):
+    '''A dense (program x hour) matrix of seconds, filled through a memory map one chunk at a time.
+    The program ids, categories and first hour are written next to it, see labels_path.'''
+    programs, first, last = hour_bounds(programs or list(profile.programs.values()))
+    matrix = np.lib.format.open_memmap(path, mode = "w+", dtype = np.float64, shape = (len(programs), last - first + 1))
+    for start in range(first, last + 1, chunk_hours):
+        end = min(start + chunk_hours, last + 1)
+        matrix[:, start - first:end - first] = profile.hourly_values(programs, start, end)
+    matrix.flush()
+    del matrix
+    with open(labels_path(path), "w") as f:
+        json.dump({"first_hour": hour_to_key(first), "programs": [p.id for p in programs], "categories": [p.category for p in programs]}, f)
+
+def read_npy(path: str, chunk_hours: int = EXPORT_CHUNK_HOURS) -> Iterator[HourRow]:
+    with open(labels_path(path)) as f:
+        labels = json.load(f)
+    first = key_to_hour(labels["first_hour"])
+    matrix = np.load(path, mmap_mode = "r")
+    for start in range(0, matrix.shape[1], chunk_hours):
+        values = np.asarray(matrix[:, start:start + chunk_hours])
+        for row, i in zip(*np.nonzero(values)):
+            yield labels["programs"][row], labels["categories"][row], first + start + int(i), float(values[row, i])
+
+def export_profile(path: str, profile: Profile, programs: list[ProgramData] | None = None):
+    fmt = transfer_format(path)
+    if fmt == "npy":
+        write_npy(path, profile, programs)
+    elif fmt == "csv":
+        write_csv(path, iter_hours(profile, programs))
+    else:
+        write_ndjson(path, iter_hours(profile, programs))
+
+def read_rows(path: str) -> Iterator[HourRow]:
+    fmt = transfer_format(path)
+    if fmt == "npy":
+        return read_npy(path)
+    if fmt == "csv":
+        return read_csv(path)
+    return read_ndjson(path)
+
+def import_rows(profile: Profile, rows: Iterable[HourRow], chunk_rows: int = IMPORT_CHUNK_ROWS) -> int:
+    '''Add `rows` to the profile's time, saving after every `chunk_rows` so the pending changes stay small.
+    Returns the number of rows imported.'''
+    count = 0
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_rows)):
+        profile.add_history(chunk)
+        profile.save()
+        count += len(chunk)
+    profile.save(compact = True)
+    return count
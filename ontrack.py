@@ -1,85 +1,69 @@
-import keyboard
-import pygetwindow as gw
-import asyncio
 import time
+STARTUP_BEGIN = time.perf_counter()
+
+import sys
+from threading import Thread
 
 from config import Config
-from data import Profile, ProgramData
+from data import Profile
 import gui
-from lib.processes import get_active_pid, try_get_proc_name
-from lib.mathlib import distance2d
+from lib.saver import BackgroundSaver
+from lib.scheduler import Scheduler
+from lib.samplers import Win32Sampler
+from lib.tracking import Tracker, schedule_tracking
 
-last_checked = time.time()
-active_window = None
+# Modules only the statistics window needs; loading any of them before the first refresh slows startup down
+STATISTICS_MODULES = ("matplotlib", "PIL", "tkcalendar", "ttkwidgets")
 
-config = Config.load()
-config.save() # ensure all fields are in the file and the file is generated if it doesn't exist
-data = Profile.load(config)
-data.save() # ensure we have at least a blank database file
-frame_rate = 60
-frame_time = 1 / frame_rate
+def load() -> tuple[Config, Profile]:
+    '''Everything startup reads from disk before the first refresh'''
+    config = Config.load() # also writes the file if it is missing or lacks some fields
+    data = Profile.load(config)
+    if not data.storage.exists():
+        data.save() # ensure we have at least a blank database file
+    return config, data
 
-async def main():
-    autosave_time = 0
-    update_time = 0
-    next_refresh = time.time()
-    app = gui.App(config, data)
-    keyboard.hook(handle_keypress)
-    # app.window.bind('<Motion>', handle_mouse)
-    while True:
-        app.window.update()
-        now = time.time()
-        await asyncio.sleep(next_refresh - now)
-        next_refresh += frame_time
-        if app.has_quit: break
-        t = time.time()
-        if t > update_time:
-            handle_mouse(app.window.winfo_pointerx(), app.window.winfo_pointery())
-            add_data()
-            update_time = t + config.update_interval
-            data.afk_time += config.update_interval
-            app.update_data(active_window)
-            app.timer_window.update()
-        if t > autosave_time:
-            data.save()
-            autosave_time = t + config.autosave_interval
+def startup_elapsed() -> float:
+    return time.perf_counter() - STARTUP_BEGIN
 
-def handle_keypress(_evt: keyboard.KeyboardEvent):
-    data.afk_time = 0
-    # print("Detected keypress, resetting AFK timer.")
-mouse_px = 0
-mouse_py = 0
-def handle_mouse(px, py):
-    global mouse_px, mouse_py
-    if (distance2d((mouse_px, mouse_py), (px, py)) < 1): return
-    (mouse_px, mouse_py) = (px, py)
-    data.afk_time = 0
-    # print("Detected mouse movement, resetting AFK timer.")
+def loaded_statistics_modules() -> list[str]:
+    return [m for m in STATISTICS_MODULES if m in sys.modules]
 
-def add_data():
-    global data
-    global last_checked
-    global active_window
+def report_startup(config: Config):
+    elapsed = startup_elapsed()
+    print(f"Started in {elapsed * 1000:.0f}ms")
+    if elapsed > config.startup_time_budget:
+        print(f"[WARNING] Startup took longer than the budget of {config.startup_time_budget * 1000:.0f}ms")
+    loaded = loaded_statistics_modules()
+    if loaded:
+        print(f"[WARNING] Statistics modules were imported during startup: {', '.join(loaded)}")
 
-    # timer update
-    now = time.time()
-    delta_time = now - last_checked
-    last_checked = now
+def main():
+    config, data = load()
+    saver = BackgroundSaver(data)
+    app = gui.App(config, data, saver)
+    sampler = Win32Sampler(lambda: (app.window.winfo_pointerx(), app.window.winfo_pointery()))
+    tracker = Tracker(config, data, sampler)
+    started = False
 
-    # Never increase program time by more than twice the update interval
-    delta_time = min(2 * config.update_interval, delta_time)
+    def refresh():
+        nonlocal started
+        if app.has_quit: return
+        data.flush_focus_log()
+        app.update_data(tracker.active_window)
+        app.timer_window.update()
+        if not started:
+            # The tracker is up and has taken its first sample, the statistics stack can load in the background now
+            started = True
+            report_startup(config)
+            Thread(target = gui.preload_statistics, name = "PreloadStatistics", daemon = True).start()
 
-    pid = get_active_pid()
-    if (pid == None): return
-    app_name = try_get_proc_name(pid, True)
-    if (app_name == None): return
-    active_window = app_name
-    
-    program = data.get_program(app_name)
+    scheduler = Scheduler(app.window)
+    app.scheduler = scheduler
+    schedule_tracking(scheduler, tracker)
+    scheduler.every(lambda: config.refresh_interval, refresh, run_now = True)
+    scheduler.every(lambda: config.autosave_interval, saver.request, "autosave")
+    scheduler.run()
 
-    if (program != None):
-        if (program.has_afk_timer() and data.afk_time >= config.afk_timeout):
-            return
-        program.add_time(delta_time)
-        
-asyncio.run(main())
+if __name__ == "__main__":
+    main()
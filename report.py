@@ -0,0 +1,127 @@
+'''Headless usage reports: `py report.py [activity|distribution] [options]`, see --help.
+Loads the profile without Tk and writes CSV or JSON to stdout, or renders the matching graph with --graph.'''
+import argparse
+import contextlib
+import csv
+import json
+import math
+import sys
+from datetime import datetime, timedelta
+
+from config import Config
+from data import Profile, QUERY_GROUP_CATEGORY, QUERY_GROUP_PROGRAM, QUERY_GROUP_TOTAL
+from lib.reports import distribution, iter_activity
+
+TIMESTEPS = {"hourly": 3600, "daily": 3600 * 24, "weekly": 3600 * 24 * 7}
+FORMATS = ("csv", "json")
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog = "report", description = "Aggregate tracked time without starting the GUI")
+    parser.add_argument("mode", nargs = "?", choices = ("activity", "distribution"), default = "activity",
+        help = "time per bucket, like the time charts, or totals over the range, like the pie charts")
+    parser.add_argument("--start", help = "first day to include (YYYY-MM-DD), defaults to the first tracked day")
+    parser.add_argument("--end", help = "last day to include (YYYY-MM-DD), defaults to the last tracked day")
+    parser.add_argument("--step", default = "daily", help = f"bucket size: {', '.join(TIMESTEPS)} or a number of seconds")
+    parser.add_argument("--group", choices = (QUERY_GROUP_TOTAL, QUERY_GROUP_CATEGORY, QUERY_GROUP_PROGRAM), default = QUERY_GROUP_CATEGORY)
+    parser.add_argument("--programs", help = "comma separated program ids, defaults to all visible programs")
+    parser.add_argument("--format", choices = FORMATS, default = "csv")
+    parser.add_argument("--skip-zero", action = "store_true", help = "leave out rows without any time")
+    parser.add_argument("--graph", metavar = "PATH", help = "render the graph to a .png or .svg file instead of writing rows")
+    args = parser.parse_args(argv)
+    if args.mode == "distribution" and args.group == QUERY_GROUP_TOTAL:
+        parser.error("distribution reports group by category or program")
+    try:
+        args.step = TIMESTEPS[args.step] if args.step in TIMESTEPS else float(args.step)
+    except ValueError:
+        parser.error(f"invalid step: {args.step}")
+    if not 0 < args.step < math.inf:
+        parser.error(f"the step must be a positive number of seconds, got {args.step:g}")
+    return args
+
+def day_start(timestamp: float) -> float:
+    return datetime.combine(datetime.fromtimestamp(timestamp).date(), datetime.min.time()).timestamp()
+
+def parse_day(day: str) -> float:
+    return datetime.strptime(day, "%Y-%m-%d").timestamp()
+
+def format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat(timespec = "seconds")
+
+def activity_rows(rows, skip_zero: bool = False):
+    # Rows come bucket by bucket, so each timestamp only needs formatting once
+    last, formatted = None, ""
+    for t, key, seconds in rows:
+        if skip_zero and not seconds:
+            continue
+        if t != last:
+            last, formatted = t, format_time(t)
+        yield formatted, key, seconds
+
+def write_rows(fields: list[str], rows, fmt: str, out = sys.stdout):
+    '''Stream `rows` as CSV with a header, or as a JSON array of objects, without collecting them first'''
+    if fmt == "csv":
+        writer = csv.writer(out, lineterminator = "\n")
+        writer.writerow(fields)
+        writer.writerows(rows)
+        return
+    out.write("[")
+    for i, row in enumerate(rows):
+        out.write(",\n" if i else "\n")
+        out.write(json.dumps(dict(zip(fields, row))))
+    out.write("\n]\n")
+
+def render_graph(args: argparse.Namespace, profile: Profile, config: Config, start: float, end: float, programs: list):
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.figure import Figure
+    from lib import graphs
+
+    figure = Figure(figsize = (12, 7), dpi = 100)
+    if args.mode == "activity":
+        split_by_categories = args.group != QUERY_GROUP_TOTAL
+        graphs.build_activity_graph(profile, config, start, end, args.step, split_by_categories, args.group == QUERY_GROUP_PROGRAM, programs, fig = figure)
+    else:
+        graphs.build_pie_chart(profile, config, start, end, args.group == QUERY_GROUP_CATEGORY, programs, fig = figure)
+    figure.savefig(args.graph)
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    # Loading reports its progress with print, which must not end up mixed with the rows on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        config = Config.load()
+        # Every chunk is queried once, caching them would only hold on to memory
+        config.query_cache_size = 0
+        profile = Profile.load(config)
+
+    programs = []
+    if args.programs:
+        for pid in args.programs.split(","):
+            if pid not in profile.programs:
+                print(f"Error: unknown program {pid}", file = sys.stderr)
+                return 1
+            programs.append(profile.programs[pid])
+    if not (args.start and args.end) and not any(p.get_hour_bounds() for p in profile.programs.values()):
+        print("Error: the profile has no tracked time yet, pass --start and --end to report on a range anyway", file = sys.stderr)
+        return 1
+    start = parse_day(args.start) if args.start else day_start(profile.get_first_timestamp())
+    end = parse_day(args.end) if args.end else day_start(profile.get_last_timestamp())
+    end = (datetime.fromtimestamp(end) + timedelta(days = 1)).timestamp()
+
+    try:
+        if args.graph:
+            render_graph(args, profile, config, start, end, programs)
+        elif args.mode == "activity":
+            write_rows(["start", "key", "seconds"], activity_rows(iter_activity(profile, start, end, args.step, args.group, programs), args.skip_zero), args.format)
+        else:
+            keys, values = distribution(profile, config, start, end, args.group == QUERY_GROUP_CATEGORY, programs)
+            total = sum(values)
+            rows = [(key, seconds, seconds / total if total else 0) for key, seconds in zip(reversed(keys), reversed(values))
+                if seconds or not args.skip_zero]
+            write_rows(["key", "seconds", "fraction"], rows, args.format)
+    except Exception as e:
+        print(f"Error building report: {e}", file = sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,30 @@
+import os
+import sys
+
+# The modules live at the repository root, next to ontrack.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import random
+import time
+
+import pytest
+
+from config import Config
+from data import CURRENT_SCHEMA_VERSION, Profile
+
+def make_profile(programs: int = 6, hours: int = 24 * 30, seed: int = 0, config: Config | None = None) -> Profile:
+    '''A profile with random hourly time for `programs` programs over the past `hours` hours'''
+    rng = random.Random(seed)
+    config = config or Config()
+    profile = Profile.from_dict(config, {"version": CURRENT_SCHEMA_VERSION})
+    now = time.time()
+    for i in range(programs):
+        program = profile.get_program(f"prog{i}")
+        program.set_category(config.categories[i % len(config.categories)])
+        for h in range(0, hours, rng.randint(1, 7)):
+            program.add_time(rng.random() * 600, now - h * 3600)
+    return profile
+
+@pytest.fixture
+def profile() -> Profile:
+    return make_profile()
@@ -0,0 +1,31 @@
+'''Replays a synthetic week of foreground samples and reports throughput and accounting error:
+`python tests/replay_benchmark.py [days] [seed]`'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from data import CURRENT_SCHEMA_VERSION, Profile
+from lib.replay import replay, synthetic_trace, trace_totals
+
+def main(argv: list[str]) -> int:
+    days = float(argv[0]) if argv else 7
+    seed = int(argv[1]) if len(argv) > 1 else 1
+    config = Config()
+    profile = Profile.from_dict(config, {"version": CURRENT_SCHEMA_VERSION})
+    events = list(synthetic_trace(1.7e9, days * 86400, ["editor", "browser", "terminal", "chat"], seed = seed))
+    start = time.perf_counter()
+    tracker = replay(profile, events)
+    elapsed = time.perf_counter() - start
+    expected = trace_totals(events, config.afk_timeout)
+    credited = sum(profile.programs[k].time for k in expected)
+    print(f"{len(events)} events, {tracker.samples} samples in {elapsed:.2f}s ({tracker.samples / elapsed:.0f} samples/s)")
+    print(f"credited {credited:.0f}s, expected {sum(expected.values()):.0f}s")
+    for name, seconds in sorted(expected.items()):
+        print(f"  {name}: {profile.programs[name].time:.0f}s / {seconds:.0f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
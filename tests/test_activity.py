@@ -0,0 +1,63 @@
+import pytest
+
+from config import Config
+from data import CURRENT_SCHEMA_VERSION, Profile
+from lib.activity import ActivityMonitor, FakeInputSource
+from lib.samplers import Sampler
+from lib.tracking import Tracker
+
+class ManualSampler(Sampler):
+    '''A sampler whose clock and foreground window are set by the test'''
+    def __init__(self, input_source: FakeInputSource, start: float = 1.7e9):
+        self.clock = 0.0
+        self.start = start
+        self.window: str | None = "editor"
+        super().__init__(input_source)
+
+    def monotonic(self) -> float:
+        return self.clock
+
+    def time(self) -> float:
+        return self.start + self.clock
+
+    def foreground_name(self) -> str | None:
+        return self.window
+
+def test_fake_input_reaches_the_monitor_once_its_time_comes():
+    clock = [0.0]
+    monitor = ActivityMonitor(lambda: clock[0])
+    source = FakeInputSource([30, 10])
+    clock[0] = 20
+    source.poll(monitor)
+    assert monitor.last_input == 10
+    assert monitor.idle_time() == 10
+    clock[0] = 100
+    source.poll(monitor)
+    assert monitor.last_input == 30
+    assert monitor.is_afk(60)
+    assert not monitor.is_afk(80)
+
+def run(tracker: Tracker, sampler: ManualSampler, until: float):
+    while sampler.clock < until:
+        sampler.clock += 1
+        tracker.sample()
+
+def test_tracker_takes_afk_state_from_the_input_source():
+    config = Config(afk_timeout = 60, adaptive_sampling = False)
+    profile = Profile.from_dict(config, {"version": CURRENT_SCHEMA_VERSION})
+    source = FakeInputSource()
+    sampler = ManualSampler(source)
+    tracker = Tracker(config, profile, sampler)
+
+    run(tracker, sampler, 100)
+    assert tracker.is_afk()
+    assert profile.afk_time == pytest.approx(100)
+
+    source.press(150)
+    run(tracker, sampler, 200)
+    assert not tracker.is_afk()
+    assert profile.afk_time == pytest.approx(50)
+
+    profile.flush_focus_log()
+    # Present for the first timeout after the start and after the input at 150
+    assert profile.programs["editor"].time == pytest.approx(60 + 50, abs = 1)
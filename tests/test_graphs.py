@@ -0,0 +1,24 @@
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+
+from lib import graphs
+from conftest import make_profile
+
+def test_fit_timestep_keeps_short_ranges():
+    assert graphs.fit_timestep(0, 7 * 86400, 86400, 100) == 86400
+
+def test_long_range_is_drawn_with_wider_buckets():
+    profile = make_profile(programs = 4, hours = 24 * 365 * 3)
+    start, end = profile.get_first_timestamp(), profile.get_last_timestamp() + 3600
+    fig, ax = graphs.build_activity_graph(profile, profile.config, start, end, 7 * 86400, fig = Figure())
+    assert 0 < len(ax.patches) <= profile.config.max_plot_buckets * len(profile.config.categories)
+
+def test_minute_steps_are_labelled_with_minutes():
+    profile = make_profile(programs = 2, hours = 24)
+    name = next(iter(profile.programs))
+    start = (profile.get_last_timestamp() // 3600) * 3600
+    profile.focus_log.add(name, start + 60, start + 1800, False)
+    fig, ax = graphs.build_activity_graph(profile, profile.config, start, start + 3600, 300, fig = Figure())
+    labels = [t.get_text() for t in ax.get_xticklabels()]
+    assert len(ax.patches) > 0 and any(":05" in label for label in labels)
@@ -0,0 +1,13 @@
+import os
+
+from lib.processes import ProcessNameCache
+
+def test_only_window_lookups_count_as_hits():
+    cache = ProcessNameCache()
+    pid = os.getpid()
+    name = cache.get_name(pid, True, window = 1)
+    assert name
+    assert cache.get_name(pid, True, window = 1) == name
+    assert cache.get_name(pid, True, window = 2) == name
+    assert (cache.hits, cache.process_hits, cache.misses) == (1, 1, 1)
+    assert cache.hit_rate() == 1 / 3
@@ -0,0 +1,21 @@
+import numpy as np
+
+from data import QUERY_GROUP_PROGRAM
+from conftest import make_profile
+
+def test_detached_range_copy_matches_the_profile(profile):
+    end = profile.get_last_timestamp() + 3600
+    start = end - 86400 * 10
+    copy = profile.detached_copy(None, start, end)
+    for step in (3600, 86400, 86400 * 7):
+        profile.query_cache.clear()
+        expected = profile.query(start, end, step, QUERY_GROUP_PROGRAM)[1]
+        profile.query_cache.clear()
+        assert np.allclose(copy.query(start, end, step, QUERY_GROUP_PROGRAM)[1], expected)
+
+def test_detached_copy_indexes_the_live_series():
+    profile = make_profile(programs = 2, hours = 24 * 90)
+    end = profile.get_last_timestamp() + 3600
+    profile.detached_copy(None, end - 86400 * 30, end)
+    series = profile.programs["prog0"].time_series
+    assert series._prefix is not None and set(series._rollups) == {"month", "week", "day"}
@@ -0,0 +1,25 @@
+import pytest
+
+from config import Config
+from data import CURRENT_SCHEMA_VERSION, Profile
+from lib.replay import read_trace, replay, synthetic_trace, trace_totals, write_trace
+
+PROGRAMS = ["editor", "browser", "terminal", "chat"]
+
+def test_replay_credits_the_present_time_of_the_trace():
+    config = Config()
+    profile = Profile.from_dict(config, {"version": CURRENT_SCHEMA_VERSION})
+    events = list(synthetic_trace(1.7e9, 2 * 86400, PROGRAMS, seed = 1))
+    tracker = replay(profile, events)
+    expected = trace_totals(events, config.afk_timeout)
+    assert tracker.samples > 0
+    assert set(expected) == {k for k, p in profile.programs.items() if p.time > 0}
+    for name, seconds in expected.items():
+        assert profile.programs[name].time == pytest.approx(seconds, rel = 1e-3)
+    assert profile.get_total_time() == pytest.approx(sum(expected.values()), rel = 5e-4)
+
+def test_trace_round_trip(tmp_path):
+    events = list(synthetic_trace(1.7e9, 3600, PROGRAMS, seed = 2))
+    path = str(tmp_path / "trace.ndjson")
+    write_trace(path, events)
+    assert list(read_trace(path)) == events
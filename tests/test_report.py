@@ -0,0 +1,21 @@
+import pytest
+
+import report
+from conftest import make_profile
+
+def test_empty_profile_is_reported_as_an_error(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    assert report.main([]) == 1
+    assert "no tracked time" in capsys.readouterr().err
+
+def test_weekly_graph_over_three_years(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    make_profile(programs = 4, hours = 24 * 365 * 3).save(compact = True)
+    assert report.main(["activity", "--step", "weekly", "--graph", str(tmp_path / "activity.png")]) == 0
+    assert (tmp_path / "activity.png").stat().st_size > 0
+
+def test_step_must_be_positive(capsys):
+    for step in ("0", "-3600", "nan", "inf"):
+        with pytest.raises(SystemExit):
+            report.parse_args(["--step", step])
+        assert "positive" in capsys.readouterr().err
@@ -0,0 +1,29 @@
+import sqlite3
+import time
+
+from config import Config
+from data import Profile
+from lib.saver import BackgroundSaver
+
+def test_failed_write_is_saved_with_the_next_one(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = Config(storage_backend = "sqlite")
+    profile = Profile.load(config)
+    profile.save()
+    saver = BackgroundSaver(profile)
+    program = profile.get_program("prog")
+    now = time.time()
+    program.add_time(100, now)
+
+    write = profile.storage.write
+    def fail_once(job):
+        monkeypatch.setattr(profile.storage, "write", write)
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(profile.storage, "write", fail_once)
+    saver.request()
+    saver.flush()
+
+    program.add_time(5, now)
+    saver.request()
+    saver.close()
+    assert Profile.load(config).programs["prog"].time == 105
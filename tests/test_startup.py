@@ -0,0 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+
+from config import Config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports ontrack like `py ontrack.py` would and runs its startup up to the first refresh, without opening any window
+STARTUP_SCRIPT = f'''
+import json, sys
+sys.path.insert(0, {ROOT!r})
+import ontrack
+ontrack.load()
+print(json.dumps({{"elapsed": ontrack.startup_elapsed(), "loaded": ontrack.loaded_statistics_modules()}}))
+'''
+
+def run_startup(cwd) -> dict:
+    result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd = cwd, capture_output = True, text = True, check = True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_startup_leaves_out_statistics_modules(tmp_path):
+    assert run_startup(tmp_path)["loaded"] == []
+
+def test_startup_fits_the_budget(tmp_path):
+    # The first run creates the config and profile files, the second one is the usual startup
+    run_startup(tmp_path)
+    assert run_startup(tmp_path)["elapsed"] < Config().startup_time_budget
@@ -0,0 +1,15 @@
+import numpy as np
+
+from lib.storage import SqliteStorage
+from lib.timeseries import bucket_hour_bounds
+from conftest import make_profile
+
+def test_sqlite_buckets_only_include_the_requested_programs(tmp_path):
+    profile = make_profile(programs = 5, hours = 24 * 20)
+    storage = SqliteStorage(str(tmp_path / "db.sqlite3"))
+    storage.import_snapshot(profile.snapshot())
+    start, end = profile.get_first_timestamp(), profile.get_last_timestamp() + 3600
+    bounds = np.array(bucket_hour_bounds(start, end, 86400))
+    ids = ["prog3", "prog1"]
+    expected = [profile.programs[k].time_series.bucketed(start, end, 86400) for k in ids]
+    assert np.allclose(storage.query_buckets(ids, bounds), expected)
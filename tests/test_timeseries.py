@@ -0,0 +1,35 @@
+from array import array
+
+from lib.timeseries import HourlySeries
+
+def test_split_before_drops_leading_empty_hours():
+    series = HourlySeries(10, array("d", [1, 2, 0, 0, 0, 5, 0]))
+    older = series.split_before(12)
+    assert (older.base, list(older.values)) == (10, [1, 2])
+    assert (series.base, list(series.values)) == (15, [5, 0])
+
+def test_split_before_long_empty_run():
+    series = HourlySeries(0, array("d", [1] + [0] * 100000 + [3]))
+    series.split_before(1)
+    assert (series.base, list(series.values)) == (100001, [3])
+
+def test_to_dict_stores_the_rollups_built_so_far():
+    series = HourlySeries(100, array("d", [1, 2, 3]))
+    assert "rollups" not in series.to_dict()
+    assert set(series.to_dict(with_rollups = True)["rollups"]) == {"month", "week", "day"}
+    series = HourlySeries(100, array("d", [1, 2, 3]))
+    series.rollup("week")
+    restored = HourlySeries.from_dict(series.to_dict())
+    assert list(restored._rollups) == ["week"]
+    restored.add(101, 4)
+    assert list(restored.rollup("week").values) == [10]
+
+def test_copy_keeps_prefix_sums_and_rollups():
+    series = HourlySeries(0, array("d", [1.0, 2.0, 3.0] * 100))
+    series.range_sum(0, 300)
+    series.rollup("day").range_sum(0, 10)
+    copy = series.copy()
+    assert copy._prefix is not None and copy._prefix is not series._prefix
+    assert copy._rollups["day"]._prefix is not None
+    copy.add(299, 1.0)
+    assert copy.range_sum(0, 300) == series.range_sum(0, 300) + 1.0
@@ -0,0 +1,48 @@
+'''Move tracked time in and out of the profile: `py transfer.py export|import PATH`, see --help.
+The format follows the extension: .csv, .ndjson/.jsonl with (program, category, hour, seconds) rows,
+or .npy with a dense program x hour matrix and its labels in a .json file of the same name.
+Don't import while OnTrack is running, it would overwrite the imported time on its next save.'''
+import argparse
+import sys
+import time
+
+from config import Config
+from data import Profile
+from lib.transfer import export_profile, import_rows, read_rows, transfer_format
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(prog = "transfer", description = "Export or import the hourly time of every program")
+    parser.add_argument("action", choices = ("export", "import"))
+    parser.add_argument("path", help = "a .csv, .ndjson, .jsonl or .npy file")
+    parser.add_argument("--programs", help = "comma separated program ids to export, defaults to all programs")
+    args = parser.parse_args(argv)
+    try:
+        transfer_format(args.path)
+    except ValueError as e:
+        parser.error(str(e))
+
+    config = Config.load()
+    profile = Profile.load(config)
+    programs = None
+    if args.programs:
+        unknown = [pid for pid in args.programs.split(",") if pid not in profile.programs]
+        if unknown:
+            print(f"Error: unknown programs {', '.join(unknown)}", file = sys.stderr)
+            return 1
+        programs = [profile.programs[pid] for pid in args.programs.split(",")]
+
+    start = time.perf_counter()
+    try:
+        if args.action == "export":
+            export_profile(args.path, profile, programs)
+            print(f"Exported to {args.path} in {time.perf_counter() - start:.1f}s")
+        else:
+            count = import_rows(profile, read_rows(args.path))
+            print(f"Imported {count} rows from {args.path} in {time.perf_counter() - start:.1f}s")
+    except Exception as e:
+        print(f"Error during {args.action}: {e}", file = sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))